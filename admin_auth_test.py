@@ -4,6 +4,7 @@ Comprehensive Admin Authentication System Tests for Böttcher Wiki
 Tests all authentication scenarios including login, token verification, protected routes, and error handling
 """
 
+import os
 import requests
 import json
 import uuid
@@ -11,7 +12,7 @@ from datetime import datetime
 import time
 
 # Get backend URL from environment
-BACKEND_URL = "https://5f463c4f-105f-4102-90ec-a413bdeb91a6.preview.emergentagent.com/api"
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
 
 class BöttcherWikiAdminAuthTester:
     def __init__(self):
@@ -431,6 +432,32 @@ class BöttcherWikiAdminAuthTester:
             
         return False
         
+    def test_logout_revokes_token(self):
+        """Test POST /api/admin/logout - the token is rejected afterwards"""
+        try:
+            # Separate token, the shared ones are still needed by other tests
+            login = requests.post(
+                f"{self.base_url}/admin/login",
+                json={"username": "admin", "password": "boettcher2024"},
+                timeout=10
+            )
+            if login.status_code != 200:
+                self.log_test("Logout Revokes Token", False, f"Login failed with status code: {login.status_code}")
+                return False
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            
+            logout = requests.post(f"{self.base_url}/admin/logout", headers=headers, timeout=10)
+            verify = requests.get(f"{self.base_url}/admin/verify", headers=headers, timeout=10)
+            if logout.status_code == 200 and verify.status_code == 401:
+                self.log_test("Logout Revokes Token", True, "Token rejected with 401 after logout")
+                return True
+            else:
+                self.log_test("Logout Revokes Token", False, f"Logout: {logout.status_code}, verify after logout: {verify.status_code}")
+                
+        except Exception as e:
+            self.log_test("Logout Revokes Token", False, f"Error: {str(e)}")
+        return False
+        
     def run_all_tests(self):
         """Run all authentication tests in sequence"""
         print("=" * 70)
@@ -448,7 +475,8 @@ class BöttcherWikiAdminAuthTester:
             ("Protected Routes - Without Auth", self.test_protected_routes_without_auth),
             ("Protected Routes - Invalid Auth", self.test_protected_routes_with_invalid_auth),
             ("Public Routes - No Auth Required", self.test_public_routes_no_auth),
-            ("JWT Token Structure", self.test_jwt_token_structure)
+            ("JWT Token Structure", self.test_jwt_token_structure),
+            ("Logout Revokes Token", self.test_logout_revokes_token)
         ]
         
         passed_tests = 0
@@ -0,0 +1,112 @@
+"""Throughput of the list and search endpoints with and without FAST_JSON.
+
+Runs the app in-process against the memory backend with 1000 entries and
+the response cache disabled, so every request builds and serializes the
+full list:
+
+    cd backend && python benchmark_json.py [--entries 1000] [--seconds 5]
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["RESPONSE_CACHE"] = "off"
+os.environ["SEARCH_RECONCILE_INTERVAL"] = "0"
+os.environ["STATS_RECONCILE_INTERVAL"] = "0"
+
+from fastapi.testclient import TestClient
+
+import server
+
+
+def sample_entry(number: int, created_at: datetime) -> dict:
+    attachment_id = str(uuid.uuid4())
+    return {
+        "id": str(uuid.uuid4()),
+        "question": f"Wie wird Maschine {number} gewartet?",
+        "answer": "Vor der Wartung die Maschine abschalten und gegen Wiedereinschalten sichern. " * 4,
+        "category": ["Wartung", "Produktion", "IT-Support", "Sicherheit"][number % 4],
+        "tags": ["wartung", f"maschine-{number}", "anleitung"],
+        "attachments": [
+            {
+                "id": attachment_id,
+                "filename": f"maschine-{number}.jpg",
+                "file_type": "images",
+                "file_size": 245760,
+                "content_type": "image/jpeg",
+                "sha256": uuid.uuid4().hex * 2,
+                "uploaded_at": created_at,
+            },
+            {
+                "id": str(uuid.uuid4()),
+                "filename": f"handbuch-{number}.pdf",
+                "file_type": "documents",
+                "file_size": 1048576,
+                "content_type": "application/pdf",
+                "sha256": uuid.uuid4().hex * 2,
+                "uploaded_at": created_at,
+            },
+        ],
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+
+async def seed(count: int):
+    start = datetime.utcnow() - timedelta(days=count)
+    await server.storage.entries.insert_many([sample_entry(number, start + timedelta(hours=number)) for number in range(count)])
+
+
+def measure(client: TestClient, send, seconds: float) -> float:
+    """Requests per second of ``send`` over ``seconds``, after a short warm-up"""
+    for _ in range(3):
+        send(client)
+    requests = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        response = send(client)
+        assert response.status_code == 200, response.text
+        requests += 1
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(seed(args.entries))
+    # Return the whole list in one response
+    server.MAX_PAGE_SIZE = args.entries
+
+    # Uncompressed, so only building and serializing the list is measured
+    headers = {"Accept-Encoding": "identity"}
+    endpoints = {
+        "GET /api/knowledge": lambda client: client.get("/api/knowledge", params={"limit": args.entries}, headers=headers),
+        "POST /api/search": lambda client: client.post(
+            "/api/search", params={"limit": args.entries}, json={"query": "Wartung Maschine"}, headers=headers
+        ),
+    }
+    if server.orjson is None:
+        print("orjson ist nicht installiert, nur die Standard-Serialisierung wird gemessen")
+    modes = [False] if server.orjson is None else [False, True]
+
+    with TestClient(server.app) as client:
+        for name, send in endpoints.items():
+            results = {}
+            for fast in modes:
+                server.FAST_JSON = fast
+                results[fast] = measure(client, send, args.seconds)
+            line = f"{name:<20} {args.entries} Einträge: Standard {results[False]:7.1f} req/s"
+            if True in results:
+                line += f", FAST_JSON {results[True]:7.1f} req/s ({results[True] / results[False]:.1f}x)"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
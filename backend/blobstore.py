@@ -0,0 +1,305 @@
+"""Content-addressed blob storage for file attachments.
+
+Attachment payloads are stored once per SHA-256 digest; knowledge entries only
+keep the digest plus a few bytes of metadata.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import uuid
+from typing import AsyncIterator, Optional
+
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+class BlobWriter:
+    """Blob written chunk by chunk; its key is known once committed.
+
+    Used as an async context manager, an uncommitted blob is discarded on exit.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.key = None
+
+    async def write(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        await self._write(chunk)
+
+    async def commit(self) -> str:
+        self.key = self._hash.hexdigest()
+        await self._commit(self.key)
+        return self.key
+
+    async def _write(self, chunk: bytes) -> None:
+        raise NotImplementedError
+
+    async def _commit(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def abort(self) -> None:
+        raise NotImplementedError
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.key is None:
+            await self.abort()
+
+
+class BlobStore:
+    """Interface for content-addressed payload storage"""
+
+    async def put(self, data: bytes, content_type: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+    def writer(self, content_type: Optional[str] = None) -> BlobWriter:
+        raise NotImplementedError
+
+    async def get(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    async def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Path of the blob on the local filesystem, if it is stored there"""
+        return None
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """Bytes ``start`` up to (excluding) ``end`` of a blob, in chunks"""
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class FileSystemBlobWriter(BlobWriter):
+    def __init__(self, store: "FileSystemBlobStore"):
+        super().__init__()
+        self.store = store
+        os.makedirs(store.root, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=store.root, suffix=".tmp")
+        self.tmp = os.fdopen(fd, "wb")
+
+    async def _write(self, chunk: bytes) -> None:
+        await asyncio.to_thread(self.tmp.write, chunk)
+
+    def _finish(self, key: str) -> None:
+        self.tmp.close()
+        path = self.store._path(key)
+        if os.path.exists(path):
+            os.unlink(self.tmp_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.tmp_path, path)
+
+    async def _commit(self, key: str) -> None:
+        await asyncio.to_thread(self._finish, key)
+
+    def _discard(self) -> None:
+        self.tmp.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+    async def abort(self) -> None:
+        await asyncio.to_thread(self._discard)
+
+
+class FileSystemBlobStore(BlobStore):
+    """Blobs as files below ``root``, sharded by the first digest bytes.
+
+    File I/O runs in the default thread pool to keep the event loop free.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def _put(self, data: bytes) -> str:
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if os.path.exists(path):
+            return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return key
+
+    def _get(self, key: str) -> bytes:
+        try:
+            with open(self._path(key), "rb") as blob:
+                return blob.read()
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def _size(self, key: str) -> int:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def _open(self, key: str):
+        try:
+            return open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def _delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def put(self, data: bytes, content_type: Optional[str] = None) -> str:
+        return await asyncio.to_thread(self._put, data)
+
+    def writer(self, content_type: Optional[str] = None) -> BlobWriter:
+        return FileSystemBlobWriter(self)
+
+    async def get(self, key: str) -> bytes:
+        return await asyncio.to_thread(self._get, key)
+
+    async def size(self, key: str) -> int:
+        return await asyncio.to_thread(self._size, key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+    async def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                         chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        blob = await asyncio.to_thread(self._open, key)
+        try:
+            await asyncio.to_thread(blob.seek, start)
+            position = start
+            while end is None or position < end:
+                length = chunk_size if end is None else min(chunk_size, end - position)
+                chunk = await asyncio.to_thread(blob.read, length)
+                if not chunk:
+                    break
+                position += len(chunk)
+                yield chunk
+        finally:
+            blob.close()
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, self._path(key))
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+
+class GridFSBlobWriter(BlobWriter):
+    """Uploads under a temporary name and renames to the digest on commit"""
+
+    def __init__(self, store: "GridFSBlobStore", content_type: Optional[str]):
+        super().__init__()
+        self.store = store
+        self.grid_in = store.bucket.open_upload_stream(
+            f"upload-{uuid.uuid4()}", metadata={"content_type": content_type}
+        )
+
+    async def _write(self, chunk: bytes) -> None:
+        await self.grid_in.write(chunk)
+
+    async def _commit(self, key: str) -> None:
+        await self.grid_in.close()
+        if await self.store.exists(key):
+            await self.store.bucket.delete(self.grid_in._id)
+        else:
+            await self.store.bucket.rename(self.grid_in._id, key)
+
+    async def abort(self) -> None:
+        await self.grid_in.abort()
+
+
+class GridFSBlobStore(BlobStore):
+    """Blobs in a GridFS bucket, using the digest as filename"""
+
+    def __init__(self, db, bucket_name: str = "blobs"):
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+        self.files = db[f"{bucket_name}.files"]
+
+    async def put(self, data: bytes, content_type: Optional[str] = None) -> str:
+        key = hashlib.sha256(data).hexdigest()
+        if await self.exists(key):
+            return key
+        await self.bucket.upload_from_stream(key, data, metadata={"content_type": content_type})
+        return key
+
+    def writer(self, content_type: Optional[str] = None) -> BlobWriter:
+        return GridFSBlobWriter(self, content_type)
+
+    async def get(self, key: str) -> bytes:
+        try:
+            stream = await self.bucket.open_download_stream_by_name(key)
+        except NoFile:
+            raise BlobNotFound(key)
+        return await stream.read()
+
+    async def size(self, key: str) -> int:
+        blob = await self.files.find_one({"filename": key}, {"length": 1})
+        if not blob:
+            raise BlobNotFound(key)
+        return blob["length"]
+
+    async def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                         chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        try:
+            stream = await self.bucket.open_download_stream_by_name(key)
+        except NoFile:
+            raise BlobNotFound(key)
+        stream.seek(start)
+        position = start
+        while end is None or position < end:
+            length = chunk_size if end is None else min(chunk_size, end - position)
+            chunk = await stream.read(length)
+            if not chunk:
+                break
+            position += len(chunk)
+            yield chunk
+
+    async def exists(self, key: str) -> bool:
+        return await self.files.find_one({"filename": key}, {"_id": 1}) is not None
+
+    async def delete(self, key: str) -> None:
+        async for blob in self.files.find({"filename": key}, {"_id": 1}):
+            await self.bucket.delete(blob["_id"])
+
+
+def create_blob_store(db) -> BlobStore:
+    """Blob store selected via BLOB_STORE (``filesystem`` or ``gridfs``)"""
+    backend = os.environ.get("BLOB_STORE", "filesystem").lower()
+    if backend == "gridfs":
+        if db is None:
+            raise ValueError("BLOB_STORE=gridfs requires the MongoDB storage backend")
+        return GridFSBlobStore(db)
+    if backend == "filesystem":
+        root = os.environ.get("UPLOAD_FOLDER", "uploads/")
+        return FileSystemBlobStore(os.path.join(root, "blobs"))
+    raise ValueError(f"Unknown BLOB_STORE backend: {backend}")
@@ -0,0 +1,48 @@
+"""Request body size limits enforced while the body is received.
+
+Form uploads are parsed, and spooled to a temporary file, before the
+endpoint runs, so a size check in the endpoint comes too late to bound what
+the server reads. The limit is applied to the ASGI receive channel instead.
+"""
+from typing import Dict, Tuple
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+
+
+class BodySizeLimitMiddleware:
+    """Rejects request bodies over the limit of their path with 413.
+
+    ``limits`` maps paths to (max bytes, error detail). A larger
+    Content-Length is refused before anything is read; bodies without one
+    are cut off as soon as they exceed the limit. The error is raised from
+    the endpoint's first read, so it is rendered like any HTTPException.
+    """
+
+    def __init__(self, app, limits: Dict[str, Tuple[int, str]]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes, detail = limit
+        content_length = Headers(scope=scope).get("content-length", "")
+        announced = int(content_length) if content_length.isdigit() else None
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            if announced is not None and announced > max_bytes:
+                raise HTTPException(status_code=413, detail=detail)
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, receive_limited, send)
@@ -0,0 +1,97 @@
+"""Response cache for public read endpoints.
+
+Responses are stored pre-serialized, so a hit is returned without running
+the query or Pydantic. Keys include a content version that every admin write
+bumps; entries of older versions are never read again and simply age out.
+
+RESPONSE_CACHE selects the backend: ``local`` (default, per process),
+``redis`` (shared between workers, needs the ``redis`` package and
+REDIS_URL) or ``off``.
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class CacheBackend:
+    """Byte store with per-entry expiry"""
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+
+class LocalCacheBackend(CacheBackend):
+    """In-process LRU with TTL, a stand-in for a shared backend"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Shared cache in Redis; eviction is left to Redis' maxmemory policy"""
+
+    def __init__(self, url: str, prefix: str = "wiki:response:"):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+
+class ResponseCache:
+    """Serialized response bodies plus their headers"""
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, dict]]:
+        value = await self.backend.get(key)
+        if value is None:
+            return None
+        headers, _, body = value.partition(b"\n")
+        return body, json.loads(headers)
+
+    async def set(self, key: str, body: bytes, headers: dict) -> None:
+        value = json.dumps(headers, separators=(",", ":")).encode("utf-8") + b"\n" + body
+        await self.backend.set(key, value, self.ttl)
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Response cache configured via RESPONSE_CACHE, None if disabled"""
+    backend = os.environ.get("RESPONSE_CACHE", "local").lower()
+    ttl = float(os.environ.get("RESPONSE_CACHE_TTL", "60"))
+    if backend == "off":
+        return None
+    if backend == "local":
+        return ResponseCache(LocalCacheBackend(int(os.environ.get("RESPONSE_CACHE_SIZE", "512"))), ttl)
+    if backend == "redis":
+        return ResponseCache(RedisCacheBackend(os.environ.get("REDIS_URL", "redis://localhost:6379/0")), ttl)
+    raise ValueError(f"Unknown RESPONSE_CACHE backend: {backend}")
@@ -0,0 +1,126 @@
+"""Content-Encoding negotiation and response compression.
+
+gzip is always available; brotli and zstd are offered when the ``brotli``
+or ``zstandard`` package is installed. Only complete (non-streamed)
+responses of text-like types are compressed, so attachment downloads,
+range responses and formats that are compressed already (JPEG, PDF, ZIP,
+...) pass through untouched.
+"""
+import gzip
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+# Codings in order of preference, with moderate levels suited to dynamic content
+CODINGS = {}
+if brotli is not None:
+    CODINGS["br"] = lambda data: brotli.compress(data, quality=5)
+if zstandard is not None:
+    CODINGS["zstd"] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+CODINGS["gzip"] = lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript", "image/svg+xml")
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Best available coding for an Accept-Encoding header, None for identity"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+
+    best = None
+    for coding in CODINGS:
+        quality = accepted.get(coding, accepted.get("*", 0.0))
+        # Ties go to the coding listed first
+        if quality > 0 and (best is None or quality > best[0]):
+            best = (quality, coding)
+    return best[1] if best else None
+
+
+def compress(data: bytes, coding: str) -> bytes:
+    return CODINGS[coding](data)
+
+
+def is_compressible(headers: Headers) -> bool:
+    """Whether a response with these headers may be compressed at all"""
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    # Attachment downloads keep their bytes and byte ranges
+    if headers.get("content-disposition", "").startswith("attachment"):
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Compresses complete responses for clients that accept it.
+
+    Responses that already carry a Content-Encoding, e.g. precompressed
+    cache entries, are sent as they are.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                start = message
+                if message["status"] != 200 or not is_compressible(Headers(raw=message["headers"])):
+                    passthrough = True
+                    await send(message)
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                headers = MutableHeaders(raw=start["headers"])
+                if "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+                passthrough = True
+                # Streamed responses and small bodies are sent unchanged
+                if message.get("more_body", False) or len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    return
+                body = compress(body, coding)
+                headers["Content-Encoding"] = coding
+                headers["Content-Length"] = str(len(body))
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+            else:
+                await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,48 @@
+"""Async MongoDB access via Motor.
+
+Pool size and timeouts are configurable through environment variables so
+concurrent requests overlap their I/O instead of blocking the event loop.
+"""
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017/")
+MONGO_DATABASE = os.environ.get("MONGO_DATABASE", "boettcher_wiki")
+
+# Environment variable -> Motor client option
+POOL_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+}
+
+DEFAULT_POOL_OPTIONS = {
+    "maxPoolSize": 100,
+    "serverSelectionTimeoutMS": 5000,
+    "connectTimeoutMS": 5000,
+}
+
+
+def client_options() -> dict:
+    options = dict(DEFAULT_POOL_OPTIONS)
+    for variable, option in POOL_OPTIONS.items():
+        value = os.environ.get(variable)
+        if value:
+            options[option] = int(value)
+    return options
+
+
+def create_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(MONGO_URL, **client_options())
+
+
+client = create_client()
+db = client[MONGO_DATABASE]
+knowledge_base = db.knowledge_base
+categories_collection = db.categories
+files_collection = db.files
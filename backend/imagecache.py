@@ -0,0 +1,163 @@
+"""Size-bounded on-disk LRU cache for derived images.
+
+Entries are files named after the hash of their key; a hit refreshes the
+file's mtime. Size and recency are read from the directory itself rather
+than kept in memory, so several worker processes can share one cache
+directory and the bound holds for all of them together. Scanning the
+directory costs a stat per file, so it is not done on every write: between
+scans each process adds what it wrote to the size found by the last scan
+and scans again once that passes the bound, after ``SCAN_EVERY_PUTS``
+writes or after ``SCAN_INTERVAL`` seconds (to notice other workers'
+writes). Concurrent requests for a key that is being produced in this
+process share one result.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Temporary files older than this are leftovers of an interrupted write
+STALE_TMP_SECONDS = 3600
+# Rescan the directory after this many writes or seconds even below the bound
+SCAN_EVERY_PUTS = 64
+SCAN_INTERVAL = 60.0
+# Eviction frees space down to this share of the bound, so the next writes
+# do not trigger another scan right away
+EVICT_TO = 0.9
+
+
+class DiskLRUCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._inflight: Dict[str, asyncio.Future] = {}
+        os.makedirs(self.root, exist_ok=True)
+        # Bytes found by the last scan, and written by this process since
+        self._scanned_bytes = self._evict()
+        self._scanned_at = time.monotonic()
+        self._written_bytes = 0
+        self._writes = 0
+        self._scanning = False
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _read(self, name: str) -> Optional[bytes]:
+        try:
+            with open(self._path(name), "rb") as cached:
+                data = cached.read()
+            os.utime(self._path(name))
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _write(self, name: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, self._path(name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _scan(self) -> List[tuple]:
+        """(mtime, name, size) of all cached files; removes stale temporary files"""
+        files = []
+        now = time.time()
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith(".tmp"):
+                        # Another worker may still be writing a recent one
+                        if now - stat.st_mtime > STALE_TMP_SECONDS:
+                            os.unlink(entry.path)
+                    elif entry.is_file():
+                        files.append((stat.st_mtime, entry.name, stat.st_size))
+                except FileNotFoundError:
+                    # Evicted or replaced by another worker meanwhile
+                    pass
+        return files
+
+    def _evict(self) -> int:
+        """Drop least recently used files once over the size bound; returns the bytes left"""
+        files = self._scan()
+        total = sum(size for _, _, size in files)
+        if total <= self.max_bytes:
+            return total
+        for _, name, size in sorted(files):
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.unlink(self._path(name))
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    def _scan_due(self) -> bool:
+        return (
+            self._scanned_bytes + self._written_bytes > self.max_bytes
+            or self._writes >= SCAN_EVERY_PUTS
+            or time.monotonic() - self._scanned_at >= SCAN_INTERVAL
+        )
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read, self._name(key))
+
+    async def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        await asyncio.to_thread(self._write, self._name(key), data)
+        # Counts replaced files twice, which at worst scans a little early
+        self._written_bytes += len(data)
+        self._writes += 1
+        if self._scanning or not self._scan_due():
+            return
+
+        self._scanning = True
+        # Writes finishing during the scan may or may not be seen by it; they
+        # are counted again on top of its result to stay on the safe side
+        self._written_bytes = 0
+        self._writes = 0
+        try:
+            self._scanned_bytes = await asyncio.to_thread(self._evict)
+            self._scanned_at = time.monotonic()
+        finally:
+            self._scanning = False
+
+    async def get_or_create(self, key: str, create: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Cached value, or the result of ``create`` shared by all concurrent callers"""
+        data = await self.get(key)
+        if data is not None:
+            return data
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data = await create()
+            await self.put(key, data)
+            future.set_result(data)
+            return data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure nobody else awaited is not logged
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
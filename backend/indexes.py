@@ -0,0 +1,86 @@
+"""MongoDB indexes required by the API's query patterns.
+
+Declared per collection and ensured idempotently at startup; existing
+indexes with the same definition are left untouched.
+"""
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from storage.base import BLOB_HOLD
+
+INDEXES = {
+    "knowledge_base": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Category filter with newest-first keyset pagination
+        IndexModel([("category", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="category_created_at"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        # Search index reconciliation polls for recent changes
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    # Attachment catalog: one row per entry and file, downloads by file id,
+    # blob reference counts before releasing a blob
+    "files": [
+        IndexModel([("entry_id", ASCENDING), ("id", ASCENDING)], name="entry_id_id_unique", unique=True),
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("blobs", ASCENDING)], name="blobs"),
+    ],
+    # Blobs kept from being released, e.g. of fresh uploads
+    "blob_holds": [
+        IndexModel([("held_at", ASCENDING)], name="held_at_ttl", expireAfterSeconds=int(BLOB_HOLD.total_seconds())),
+    ],
+    "categories": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+    ],
+}
+
+
+# Indexes of earlier versions that conflict with the declarations above
+OBSOLETE_INDEXES = {
+    # Allowed one catalog row per file id, whichever entry was written last
+    "files": ["id_unique", "entry_id"],
+}
+
+
+async def ensure_indexes(db) -> dict:
+    """Drop obsolete and create missing indexes; returns the names that could not be created"""
+    failed = {}
+    for collection_name, names in OBSOLETE_INDEXES.items():
+        existing = await db[collection_name].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection_name].drop_index(name)
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        for model in models:
+            try:
+                await collection.create_indexes([model])
+            except OperationFailure as e:
+                # e.g. duplicate values for a unique index or a conflicting definition
+                name = model.document["name"]
+                print(f"Index {collection_name}.{name} konnte nicht angelegt werden: {e}")
+                failed.setdefault(collection_name, []).append(name)
+    return failed
+
+
+async def index_usage(db) -> dict:
+    """Per-collection index usage from $indexStats, flagged against the declarations"""
+    report = {}
+    for collection_name, models in INDEXES.items():
+        declared = {model.document["name"] for model in models}
+        indexes = []
+        async for stats in db[collection_name].aggregate([{"$indexStats": {}}]):
+            accesses = stats.get("accesses", {})
+            indexes.append({
+                "name": stats["name"],
+                "key": dict(stats["key"]),
+                "ops": accesses.get("ops", 0),
+                "since": accesses.get("since"),
+                "declared": stats["name"] in declared,
+            })
+        present = {index["name"] for index in indexes}
+        report[collection_name] = {
+            "indexes": sorted(indexes, key=lambda index: index["name"]),
+            "missing": sorted(declared - present),
+        }
+    return report
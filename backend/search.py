@@ -0,0 +1,691 @@
+"""In-process full-text search over knowledge entries.
+
+Entries are analyzed for German (lowercasing, umlaut/ß folding, stopwords,
+CISTEM stemming) into an inverted index and ranked with BM25, weighting
+matches in the question and tags above matches in the answer.
+"""
+import asyncio
+import bisect
+import functools
+import hashlib
+import heapq
+import math
+import re
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Field weights for the combined (BM25F-style) term frequency
+FIELD_BOOSTS = {
+    "question": 3.0,
+    "tags": 2.0,
+    "category": 1.5,
+    "answer": 1.0,
+}
+
+# Weight of terms that only match the last query word as a prefix
+PREFIX_WEIGHT = 0.5
+MIN_PREFIX_LENGTH = 3
+# Completions of the last query word that are searched, most frequent first
+MAX_PREFIX_TERMS = 16
+
+# Stored folded (see fold), so "für" and "fur" are both filtered
+STOPWORDS = frozenset("""
+    aber alle allem allen aller alles als also am an ander andere anderem anderen
+    anderer anderes anderm andern anders auch auf aus bei bin bis bist da damit
+    dann das dass dasselbe dazu dein deine deinem deinen deiner dem demselben den
+    denn denselben der derer derselbe derselben des desselben dessen dich die dies
+    diese dieselbe dieselben diesem diesen dieser dieses dir doch dort du durch ein
+    eine einem einen einer eines einig einige einigem einigen einiger einiges
+    einmal er es etwas euch euer eure eurem euren eurer eures fur gegen gewesen
+    hab habe haben hat hatte hatten hier hin hinter ich ihm ihn ihnen ihr ihre
+    ihrem ihren ihrer ihres im in indem ins ist jede jedem jeden jeder jedes jene
+    jenem jenen jener jenes jetzt kann kein keine keinem keinen keiner keines
+    konnen konnte machen man manche manchem manchen mancher manches mein meine
+    meinem meinen meiner meines mich mir mit muss musste nach nicht nichts noch nun
+    nur ob oder ohne sehr sein seine seinem seinen seiner seines selbst sich sie
+    sind so solche solchem solchen solcher solches soll sollte sondern sonst uber
+    um und uns unser unsere unserem unseren unserer unseres unter viel vom von vor
+    wahrend war waren warst was weg weil weiter welche welchem welchen welcher
+    welches wenn werde werden wie wieder will wir wird wirst wo wollen wollte
+    wurde wurden zu zum zur zwar zwischen
+""".split())
+
+_FOLDING = str.maketrans({"ä": "a", "ö": "o", "ü": "u", "ß": "ss"})
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# CISTEM stemmer (Weissweiler & Fraser, 2017), case-insensitive variant
+_STRIP_GE = re.compile(r"^ge(.{4,})")
+_REPL_DOUBLE = re.compile(r"(.)\1")
+_STRIP_EMR = re.compile(r"e[mr]$")
+_STRIP_ND = re.compile(r"nd$")
+_STRIP_T = re.compile(r"t$")
+_STRIP_ESN = re.compile(r"[esn]$")
+_RESTORE_DOUBLE = re.compile(r"(.)\*")
+
+
+def fold(text: str) -> str:
+    """Lowercase and fold umlauts, ß and remaining diacritics to ASCII"""
+    text = text.lower().translate(_FOLDING)
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(fold(text))
+
+
+@functools.lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Stem an already folded word"""
+    if len(word) <= 3:
+        return word
+
+    word = _STRIP_GE.sub(r"\1", word)
+    word = word.replace("sch", "$").replace("ei", "%").replace("ie", "&")
+    word = _REPL_DOUBLE.sub(r"\1*", word)
+
+    while len(word) > 3:
+        if len(word) > 5:
+            word, stripped = _STRIP_EMR.subn("", word)
+            if stripped:
+                continue
+            word, stripped = _STRIP_ND.subn("", word)
+            if stripped:
+                continue
+        word, stripped = _STRIP_T.subn("", word)
+        if stripped:
+            continue
+        word, stripped = _STRIP_ESN.subn("", word)
+        if stripped:
+            continue
+        break
+
+    word = _RESTORE_DOUBLE.sub(r"\1\1", word)
+    return word.replace("%", "ei").replace("&", "ie").replace("$", "sch")
+
+
+def analyze(text: str) -> List[str]:
+    """Index terms for a piece of text"""
+    return [stem(token) for token in tokenize(text) if token not in STOPWORDS]
+
+
+def _entry_fingerprint(entry: dict) -> int:
+    """Stable 64-bit hash of everything about an entry that affects search results"""
+    created = entry.get("created_at")
+    if isinstance(created, datetime):
+        # As read back from MongoDB, so the writing worker and the others agree
+        created = created.replace(microsecond=created.microsecond // 1000 * 1000).isoformat()
+    fields = [entry["id"], created] + [_field_text(entry, field) for field in ("question", "answer", "tags", "category")]
+    digest = hashlib.blake2b("\x1f".join(str(value) for value in fields).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _field_text(entry: dict, field: str) -> str:
+    value = entry.get(field) or ""
+    if isinstance(value, list):
+        return " ".join(str(item) for item in value)
+    return str(value)
+
+
+class SearchIndex:
+    """Inverted index with BM25 ranking, keyed by entry id"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, boosts: Optional[Dict[str, float]] = None):
+        self.k1 = k1
+        self.b = b
+        self.boosts = boosts or FIELD_BOOSTS
+        self.clear()
+
+    def clear(self):
+        # term -> {entry_id: boosted term frequency}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        # Sorted vocabulary for prefix lookups
+        self._terms: List[str] = []
+        # Per-entry boosted document length, category and creation time
+        self._lengths: Dict[str, float] = {}
+        self._categories: Dict[str, Optional[str]] = {}
+        self._created: Dict[str, datetime] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._total_length = 0.0
+        # Largest term frequency per term and shortest document ever indexed; both
+        # bound a term's score and may be stale after removals, which only loosens them
+        self._max_tf: Dict[str, float] = {}
+        self._min_length = math.inf
+        # XOR of the entry fingerprints, equal for indexes with the same contents
+        self._fingerprints: Dict[str, int] = {}
+        self._fingerprint = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the indexed contents, e.g. to key cached results across workers"""
+        return f"{self._fingerprint:016x}-{len(self)}"
+
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self._lengths
+
+    def entry_ids(self) -> Set[str]:
+        return set(self._lengths)
+
+    def rank_key(self, entry_id: str, score: float) -> Tuple[float, datetime, str]:
+        """Sort key of a hit, usable as ``after`` for the next page"""
+        return score, self._created[entry_id], entry_id
+
+    def build(self, entries: Iterable[dict]):
+        self.clear()
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry: dict):
+        """Index an entry; needs id, question, answer, tags, category and created_at"""
+        entry_id = entry["id"]
+        if entry_id in self._lengths:
+            self.remove(entry_id)
+
+        frequencies: Dict[str, float] = {}
+        length = 0.0
+        for field, boost in self.boosts.items():
+            terms = analyze(_field_text(entry, field))
+            length += boost * len(terms)
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0.0) + boost
+
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[entry_id] = frequency
+            if frequency > self._max_tf.get(term, 0.0):
+                self._max_tf[term] = frequency
+
+        self._lengths[entry_id] = length
+        self._categories[entry_id] = entry.get("category")
+        self._created[entry_id] = entry.get("created_at") or datetime.min
+        self._doc_terms[entry_id] = list(frequencies)
+        self._total_length += length
+        if length:
+            self._min_length = min(self._min_length, length)
+        self._fingerprints[entry_id] = _entry_fingerprint(entry)
+        self._fingerprint ^= self._fingerprints[entry_id]
+
+    def remove(self, entry_id: str):
+        length = self._lengths.pop(entry_id, None)
+        if length is None:
+            return
+
+        del self._categories[entry_id]
+        del self._created[entry_id]
+        self._fingerprint ^= self._fingerprints.pop(entry_id)
+        self._total_length -= length
+        for term in self._doc_terms.pop(entry_id):
+            postings = self._postings[term]
+            del postings[entry_id]
+            if not postings:
+                del self._postings[term]
+                del self._max_tf[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + "\x7f")
+        return self._terms[start:end]
+
+    def _query_terms(self, query: str) -> Dict[str, float]:
+        """Query terms with weights; the last word also matches as a prefix"""
+        tokens = tokenize(query)
+        weights: Dict[str, float] = {}
+        for token in tokens:
+            if token not in STOPWORDS:
+                weights[stem(token)] = 1.0
+
+        if tokens and len(tokens[-1]) >= MIN_PREFIX_LENGTH:
+            postings = self._postings
+            completions = heapq.nlargest(
+                MAX_PREFIX_TERMS, self._prefix_terms(tokens[-1]), key=lambda term: len(postings[term])
+            )
+            for term in completions:
+                weights.setdefault(term, PREFIX_WEIGHT)
+        return weights
+
+    def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[float, datetime, str]] = None,
+    ) -> List[Tuple[str, float]]:
+        """(entry_id, score) pairs, best first; ties broken by newest entry, then id.
+
+        ``after`` is the (score, created_at, entry_id) key of the last hit of
+        the previous page. With a ``limit``, terms are scored in order of their
+        score bound and, MaxScore-style, entries that can no longer reach the
+        page are neither admitted nor kept.
+        """
+        total = len(self._lengths)
+        if not total:
+            return []
+
+        lengths = self._lengths
+        categories = self._categories
+        created = self._created
+        k1 = self.k1
+        # BM25 length normalisation: k1 * (1 - b + b * length / average_length)
+        norm_base = k1 * (1.0 - self.b)
+        norm_slope = k1 * self.b * total / (self._total_length or 1.0)
+
+        terms = []
+        min_norm = norm_base + norm_slope * self._min_length
+        for term, weight in self._query_terms(query).items():
+            postings = self._postings.get(term)
+            if postings:
+                frequency = len(postings)
+                idf = weight * (k1 + 1.0) * math.log(1.0 + (total - frequency + 0.5) / (frequency + 0.5))
+                max_tf = self._max_tf[term]
+                terms.append((idf * max_tf / (max_tf + min_norm), idf, postings))
+        # Highest possible contribution first, usually the rarest terms
+        terms.sort(key=lambda term: term[0], reverse=True)
+        # Bound of what the terms after each one can still add
+        bounds = [0.0] * len(terms)
+        for position in range(len(terms) - 1, 0, -1):
+            bounds[position - 1] = terms[position][0] + bounds[position]
+
+        def rank(item):
+            return item[1], created[item[0]], item[0]
+
+        scores: Dict[str, float] = {}
+        # Score the limit-th best candidate is already sure to reach
+        threshold = None
+        for (bound, idf, postings), remaining in zip(terms, bounds):
+            if threshold is None or bound + remaining >= threshold:
+                for entry_id, tf in postings.items():
+                    if category is not None and categories[entry_id] != category:
+                        continue
+                    score = idf * tf / (tf + norm_base + norm_slope * lengths[entry_id])
+                    scores[entry_id] = scores.get(entry_id, 0.0) + score
+            else:
+                # Entries not scored yet cannot make the page any more
+                if len(scores) < len(postings):
+                    matched = [entry_id for entry_id in scores if entry_id in postings]
+                else:
+                    matched = [entry_id for entry_id in postings if entry_id in scores]
+                for entry_id in matched:
+                    tf = postings[entry_id]
+                    scores[entry_id] += idf * tf / (tf + norm_base + norm_slope * lengths[entry_id])
+
+            # Pruning needs a page threshold above what the remaining terms can add
+            if limit is None or len(scores) < limit or not remaining or max(scores.values()) <= remaining:
+                continue
+            if after is None:
+                certain = scores.values()
+            else:
+                # On the page whatever the remaining terms add
+                certain = [
+                    score for entry_id, score in scores.items()
+                    if (score + remaining, created[entry_id], entry_id) < after
+                ]
+            best = heapq.nlargest(limit, certain)
+            if len(best) == limit and best[-1] > remaining:
+                threshold = best[-1]
+                scores = {entry_id: score for entry_id, score in scores.items() if score + remaining >= threshold}
+
+        if after is not None:
+            scores = dict(item for item in scores.items() if rank(item) < after)
+
+        if limit is not None:
+            return heapq.nlargest(limit, scores.items(), key=rank)
+        return sorted(scores.items(), key=rank, reverse=True)
+
+
+class SearchIndexReconciler:
+    """Applies writes made by other workers to the local indexes.
+
+    Tails a change stream when the deployment supports one (replica set or
+    sharded cluster). Otherwise it polls for entries whose ``updated_at``
+    moved past the last seen watermark. Deletions are detected by diffing
+    entry ids: on every delete event, whenever the document count no longer
+    matches the index, and every ``id_diff_interval`` seconds, since a
+    deletion and an insert elsewhere leave the count unchanged.
+    """
+
+    # Overlap between polls to tolerate clock skew between workers
+    CLOCK_SKEW = timedelta(seconds=2)
+
+    def __init__(self, indexes: list, repository, projection: dict, interval: float = 5.0,
+                 id_diff_interval: float = 60.0):
+        # Indexes share the add/remove/clear/entry_ids interface of SearchIndex
+        self.indexes = indexes
+        # A storage.KnowledgeRepository
+        self.repository = repository
+        self.projection = dict(projection, updated_at=1)
+        self.interval = interval
+        self.id_diff_interval = id_diff_interval
+        self._watermark: Optional[datetime] = None
+        self._next_id_diff = 0.0
+
+    def _add(self, entry: dict):
+        for index in self.indexes:
+            index.add(entry)
+        self._advance(entry)
+
+    def _advance(self, entry: dict):
+        updated_at = entry.get("updated_at")
+        if updated_at and (self._watermark is None or updated_at > self._watermark):
+            self._watermark = updated_at
+
+    async def rebuild(self):
+        """Full build from the collection"""
+        for index in self.indexes:
+            index.clear()
+        self._watermark = None
+        self._next_id_diff = time.monotonic() + self.id_diff_interval
+        async for entry in self.repository.iter_entries(self.projection):
+            self._add(entry)
+
+    async def reconcile_deletions(self, force: bool = False):
+        """Diff the indexed against the stored entry ids if they may differ"""
+        primary = self.indexes[0]
+        now = time.monotonic()
+        if now >= self._next_id_diff:
+            force = True
+        if not force and await self.repository.count() == len(primary):
+            return
+
+        self._next_id_diff = now + self.id_diff_interval
+        stored_ids = set(await self.repository.entry_ids())
+        indexed_ids = primary.entry_ids()
+        for entry_id in indexed_ids - stored_ids:
+            for index in self.indexes:
+                index.remove(entry_id)
+        missing_ids = list(stored_ids - indexed_ids)
+        if missing_ids:
+            for entry in await self.repository.get_many(missing_ids, self.projection):
+                self._add(entry)
+
+    async def sync_once(self):
+        """Apply entries changed since the last poll and drop deleted ones"""
+        changed_since = None
+        if self._watermark is not None:
+            changed_since = self._watermark - self.CLOCK_SKEW
+        async for entry in self.repository.iter_entries(self.projection, changed_since):
+            self._add(entry)
+        await self.reconcile_deletions()
+
+    async def _tail_change_stream(self):
+        async with self.repository.watch(self.projection) as stream:
+            # Catch up on changes made before the stream was opened
+            await self.sync_once()
+            async for change in stream:
+                entry = change.get("fullDocument")
+                if change["operationType"] == "delete" or entry is None:
+                    # Delete events carry only the _id; an insert may already have restored the count
+                    await self.reconcile_deletions(force=True)
+                else:
+                    self._add({field: entry.get(field) for field in self.projection if field != "_id"})
+
+    async def run(self):
+        try:
+            await self._tail_change_stream()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Standalone servers and the memory backend have no change streams
+            print(f"Change streams unavailable, polling for search index changes: {e}")
+
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync_once()
+            except Exception as e:
+                print(f"Error reconciling search index: {e}")
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance, or max_distance + 1 if it is larger"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous_previous: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_minimum = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_minimum = min(row_minimum, value)
+        if row_minimum > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _trigrams(word: str) -> Set[str]:
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestIndex:
+    """Completion index over questions, tags and category names.
+
+    Words are looked up exactly, by prefix (sorted vocabulary) and with a
+    bounded edit distance (trigram candidates), so "schweisen" still
+    completes to entries about "Schweißen".
+    """
+
+    EXACT_WEIGHT = 1.0
+    PREFIX_WEIGHT = 0.8
+    FUZZY_WEIGHT = 0.6
+    MAX_PREFIX_WORDS = 64
+    MAX_FUZZY_CANDIDATES = 256
+    # Upper bound of suggestions scored per query
+    MAX_CANDIDATES = 5000
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Drop all entries; registered categories are kept"""
+        categories = getattr(self, "_categories", set())
+        # (type, key) -> {"text", "type", "entry_id", "category", "refs", "words"}
+        self._suggestions: Dict[Tuple[str, str], dict] = {}
+        self._entry_keys: Dict[str, List[Tuple[str, str]]] = {}
+        self._categories: Set[str] = set()
+        # Folded word -> suggestions containing it
+        self._word_keys: Dict[str, Set[Tuple[str, str]]] = {}
+        self._words: List[str] = []
+        self._trigrams: Dict[str, Set[str]] = {}
+        for name in categories:
+            self.add_category(name)
+
+    def __len__(self) -> int:
+        return len(self._entry_keys)
+
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self._entry_keys
+
+    def entry_ids(self) -> Set[str]:
+        return set(self._entry_keys)
+
+    def build(self, entries: Iterable[dict]):
+        self.clear()
+        for entry in entries:
+            self.add(entry)
+
+    def _acquire(self, key: Tuple[str, str], text: str, entry_id: Optional[str] = None, category: Optional[str] = None):
+        suggestion = self._suggestions.get(key)
+        if suggestion is not None:
+            suggestion["refs"] += 1
+            return
+
+        words = frozenset(tokenize(text))
+        self._suggestions[key] = {
+            "text": text, "type": key[0], "entry_id": entry_id, "category": category, "refs": 1, "words": words
+        }
+        for word in words:
+            keys = self._word_keys.get(word)
+            if keys is None:
+                keys = self._word_keys[word] = set()
+                bisect.insort(self._words, word)
+                for trigram in _trigrams(word):
+                    self._trigrams.setdefault(trigram, set()).add(word)
+            keys.add(key)
+
+    def _release(self, key: Tuple[str, str]):
+        suggestion = self._suggestions[key]
+        suggestion["refs"] -= 1
+        if suggestion["refs"]:
+            return
+
+        del self._suggestions[key]
+        for word in suggestion["words"]:
+            keys = self._word_keys[word]
+            keys.discard(key)
+            if keys:
+                continue
+            del self._word_keys[word]
+            del self._words[bisect.bisect_left(self._words, word)]
+            for trigram in _trigrams(word):
+                words = self._trigrams[trigram]
+                words.discard(word)
+                if not words:
+                    del self._trigrams[trigram]
+
+    def add(self, entry: dict):
+        entry_id = entry["id"]
+        if entry_id in self._entry_keys:
+            self.remove(entry_id)
+
+        keys = []
+        question = entry.get("question")
+        if question:
+            key = ("question", entry_id)
+            self._acquire(key, question, entry_id=entry_id, category=entry.get("category"))
+            keys.append(key)
+        for tag in entry.get("tags") or []:
+            key = ("tag", fold(tag))
+            self._acquire(key, tag)
+            keys.append(key)
+        if entry.get("category"):
+            key = ("category", entry["category"])
+            self._acquire(key, entry["category"], category=entry["category"])
+            keys.append(key)
+        self._entry_keys[entry_id] = keys
+
+    def remove(self, entry_id: str):
+        for key in self._entry_keys.pop(entry_id, []):
+            self._release(key)
+
+    def add_category(self, name: str):
+        """Register a category that may not have entries yet"""
+        if name not in self._categories:
+            self._categories.add(name)
+            self._acquire(("category", name), name, category=name)
+
+    def remove_category(self, name: str):
+        if name in self._categories:
+            self._categories.discard(name)
+            self._release(("category", name))
+
+    def _fuzzy_words(self, token: str, prefix: bool) -> List[str]:
+        max_distance = 1 if len(token) <= 5 else 2
+        query_trigrams = _trigrams(token)
+        if prefix:
+            # The unfinished last word has no closing boundary
+            query_trigrams = {trigram for trigram in query_trigrams if not trigram.endswith("$")}
+
+        shared: Dict[str, int] = {}
+        for trigram in query_trigrams:
+            for word in self._trigrams.get(trigram, ()):
+                shared[word] = shared.get(word, 0) + 1
+
+        # Every edit destroys at most three trigrams
+        required = len(query_trigrams) - 3 * max_distance
+        candidates = [
+            (count, word) for word, count in shared.items()
+            if count >= required and len(word) >= len(token) - max_distance
+            and (prefix or len(word) <= len(token) + max_distance)
+        ]
+
+        matches = []
+        for _, word in heapq.nlargest(self.MAX_FUZZY_CANDIDATES, candidates):
+            if prefix:
+                distance = min(
+                    edit_distance(token, word[:length], max_distance)
+                    for length in range(max(1, len(token) - max_distance), len(token) + max_distance + 1)
+                )
+            else:
+                distance = edit_distance(token, word, max_distance)
+            if distance <= max_distance:
+                matches.append(word)
+        return matches
+
+    def _token_matches(self, token: str, prefix: bool) -> Dict[str, float]:
+        """Vocabulary words matching a query word, with match weights.
+
+        Typo tolerance only kicks in when the word matches nothing exactly
+        or as a prefix.
+        """
+        matches: Dict[str, float] = {}
+        if prefix:
+            start = bisect.bisect_left(self._words, token)
+            for word in self._words[start:start + self.MAX_PREFIX_WORDS]:
+                if not word.startswith(token):
+                    break
+                matches[word] = self.PREFIX_WEIGHT
+        if token in self._word_keys:
+            matches[token] = self.EXACT_WEIGHT
+        if not matches and len(token) >= MIN_PREFIX_LENGTH:
+            for word in self._fuzzy_words(token, prefix):
+                matches[word] = self.FUZZY_WEIGHT
+        return matches
+
+    def suggest(self, query: str, limit: int = 10) -> List[dict]:
+        """Best completions; every query word that matches anything must match"""
+        tokens = tokenize(query)
+        complete = query[-1:].isspace()
+
+        token_matches = []
+        for position, token in enumerate(tokens):
+            prefix = position == len(tokens) - 1 and not complete
+            matches = self._token_matches(token, prefix)
+            if matches:
+                token_matches.append(matches)
+        if not token_matches:
+            return []
+
+        # Collect candidates from the most selective query word, best matches first
+        token_matches.sort(key=lambda matches: sum(len(self._word_keys[word]) for word in matches))
+        scores: Dict[Tuple[str, str], float] = {}
+        for word, weight in sorted(token_matches[0].items(), key=lambda item: -item[1]):
+            for key in self._word_keys[word]:
+                if key not in scores:
+                    scores[key] = weight
+            if len(scores) >= self.MAX_CANDIDATES:
+                break
+
+        for matches in token_matches[1:]:
+            narrowed = {}
+            for key, score in scores.items():
+                weight = max((matches.get(word, 0.0) for word in self._suggestions[key]["words"]), default=0.0)
+                if weight:
+                    narrowed[key] = score + weight
+            scores = narrowed
+
+        def rank(item):
+            key, score = item
+            return score, -len(self._suggestions[key]["text"])
+
+        return [
+            {field: value for field, value in self._suggestions[key].items() if field not in ("refs", "words")}
+            for key, _ in heapq.nlargest(limit, scores.items(), key=rank)
+        ]
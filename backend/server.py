@@ -1,20 +1,37 @@
-from fastapi import FastAPI, HTTPException, status, Depends, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, status, Depends, File, UploadFile, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime, timedelta
+from fastapi.responses import Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, field_validator
+from typing import Dict, List, Optional, Set
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import os
-from pymongo import MongoClient
+import asyncio
 import uuid
-import re
 import hashlib
 import jwt
 import base64
-import io
-from PIL import Image
+import json
 import magic
+from urllib.parse import urlencode
+from blobstore import BlobNotFound, create_blob_store
+from cache import create_response_cache
+from bodylimit import BodySizeLimitMiddleware
+from compression import CompressionMiddleware, compress, negotiate
+from storage import attachment_blobs, create_storage
+from search import SearchIndex, SearchIndexReconciler, SuggestIndex
+from stats import STATS_PROJECTION, counter_delta, reconcile_stats, run_stats_reconciler, stats_view
+from imagecache import DiskLRUCache
+from tokens import VerifiedTokenCache, create_revocation_list, token_id
+from thumbnails import RENDITION_FORMATS, RENDITION_SIZES, ThumbnailRenderer, available_formats
+
+try:
+    import orjson
+except ImportError:  # optional, only needed for FAST_JSON
+    orjson = None
 
 app = FastAPI(title="Böttcher Wiki API", version="1.0.0")
 
@@ -25,15 +42,56 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Link", "X-Next-Cursor"],
+)
+
+# gzip/brotli/zstd for text responses of at least this many bytes
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# Entries and categories, stored in MongoDB or in memory (STORAGE_BACKEND)
+storage = create_storage()
+
+# Serialized responses of public read endpoints, keyed by content version
+response_cache = create_response_cache()
+
+# Attachment payloads live in a content-addressed blob store
+blob_store = create_blob_store(storage.db)
+
+# Image thumbnails are rendered in worker processes, a few jobs at a time
+thumbnail_renderer = ThumbnailRenderer(
+    workers=int(os.environ.get("THUMBNAIL_WORKERS", "2")),
+    max_pending=int(os.environ.get("THUMBNAIL_QUEUE_SIZE", "4")),
+)
+DEFAULT_THUMBNAIL_SIZE = 200
+
+# Images resized on demand are kept in a size-bounded disk cache
+image_cache = DiskLRUCache(
+    os.environ.get("IMAGE_CACHE_DIR", os.path.join(os.environ.get("UPLOAD_FOLDER", "uploads/"), "cache")),
+    int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
 )
+MAX_IMAGE_DIMENSION = 2000
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
-client = MongoClient(MONGO_URL)
-db = client.boettcher_wiki
-knowledge_base = db.knowledge_base
-categories_collection = db.categories
-files_collection = db.files
+# In-process full-text and completion indexes, updated on every write of
+# this worker and reconciled periodically with writes of other workers
+SEARCH_INDEX_PROJECTION = {"_id": 0, "id": 1, "question": 1, "answer": 1, "tags": 1, "category": 1, "created_at": 1}
+SEARCH_RECONCILE_INTERVAL = float(os.environ.get("SEARCH_RECONCILE_INTERVAL", "5"))
+MAX_SUGGESTIONS = 20
+
+# Maintained statistics are recomputed from scratch every N seconds (0 = only at startup)
+STATS_RECONCILE_INTERVAL = float(os.environ.get("STATS_RECONCILE_INTERVAL", "3600"))
+
+# Serialize list and search responses straight from the documents with orjson,
+# skipping the Pydantic summary models
+FAST_JSON = os.environ.get("FAST_JSON", "false").lower() == "true"
+if FAST_JSON and orjson is None:
+    print("FAST_JSON ist aktiviert, aber orjson ist nicht installiert - Standard-Serialisierung wird verwendet")
+    FAST_JSON = False
+search_index = SearchIndex()
+suggest_index = SuggestIndex()
+search_reconciler = SearchIndexReconciler(
+    [search_index, suggest_index], storage.entries, SEARCH_INDEX_PROJECTION, SEARCH_RECONCILE_INTERVAL
+)
 
 # JWT Configuration
 SECRET_KEY = "boettcher-wiki-secret-key-2024"
@@ -43,6 +101,10 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 480  # 8 hours
 # Security
 security = HTTPBearer()
 
+# Payloads of verified tokens (skips the signature check) and revoked token ids
+verified_tokens = VerifiedTokenCache(int(os.environ.get("TOKEN_CACHE_SIZE", "1024")))
+revoked_tokens = create_revocation_list()
+
 # File upload configuration
 ALLOWED_EXTENSIONS = {
     'images': ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp'],
@@ -52,6 +114,37 @@ ALLOWED_EXTENSIONS = {
     'other': ['zip', 'rar', '7z']
 }
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# Uploads are read and stored in chunks of this size
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Room for multipart boundaries and part headers on top of the file itself
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+# Bound what is read (and spooled by the form parser) before the upload endpoint runs
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={"/api/upload": (MAX_FILE_SIZE + UPLOAD_FORM_OVERHEAD, "Datei zu groß (max. 10MB)")},
+)
+# Bulk import: entries per bulk write, longest accepted NDJSON line, reported errors
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_LINE_SIZE = 64 * 1024 * 1024
+MAX_IMPORT_ERRORS = 100
+# Export documents without legacy inline payloads
+EXPORT_PROJECTION = {"_id": 0, "attachments.file_data": 0, "attachments.thumbnail": 0}
+# Batch endpoint: operations per request
+MAX_BATCH_OPERATIONS = 1000
+# Sniffed content types that are never accepted, whatever the extension
+BLOCKED_CONTENT_TYPES = {
+    "application/x-dosexec", "application/x-executable", "application/x-sharedlib",
+    "application/x-mach-binary", "application/x-msdownload",
+}
+
+# Keyset pagination: default and hard maximum page size
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 200
+
+# Fields selectable via ?fields= on listing and search
+SUMMARY_FIELDS = ["id", "question", "answer", "category", "tags", "attachments", "created_at", "updated_at", "rev"]
+ATTACHMENT_SUMMARY_FIELDS = ["id", "filename", "file_type", "file_size", "content_type", "sha256", "uploaded_at"]
 
 # Admin credentials
 ADMIN_CREDENTIALS = {
@@ -59,6 +152,12 @@ ADMIN_CREDENTIALS = {
     "manager": "wiki2024"
 }
 
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC datetime as stored everywhere, from a naive or timezone-aware one"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
 # Pydantic models
 class FileAttachment(BaseModel):
     id: Optional[str] = None
@@ -66,10 +165,14 @@ class FileAttachment(BaseModel):
     file_type: str
     file_size: int
     content_type: str
-    file_data: str  # Base64 encoded
-    thumbnail: Optional[str] = None  # Base64 encoded thumbnail for images
+    sha256: Optional[str] = None  # Key in the blob store
+    file_data: Optional[str] = None  # Legacy Base64 payload, only accepted as input
+    thumbnail: Optional[str] = None  # Legacy Base64 thumbnail
+    thumbnails: Optional[Dict[str, Dict[str, str]]] = None  # Rendition blob keys by size and format
     uploaded_at: Optional[datetime] = None
 
+    _naive_utc = field_validator("uploaded_at")(naive_utc)
+
 class KnowledgeEntry(BaseModel):
     id: Optional[str] = None
     question: str
@@ -79,6 +182,33 @@ class KnowledgeEntry(BaseModel):
     attachments: List[FileAttachment] = []
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    rev: Optional[int] = None  # revision, increased on every change
+
+    # Timestamps with an offset (e.g. "...Z" from an import) would not compare with stored ones
+    _naive_utc = field_validator("created_at", "updated_at")(naive_utc)
+
+class AttachmentSummary(BaseModel):
+    id: Optional[str] = None
+    filename: Optional[str] = None
+    file_type: Optional[str] = None
+    file_size: Optional[int] = None
+    content_type: Optional[str] = None
+    sha256: Optional[str] = None
+    uploaded_at: Optional[datetime] = None
+    thumbnail_url: Optional[str] = None
+    thumbnail_urls: Optional[Dict[str, str]] = None
+
+class KnowledgeEntrySummary(BaseModel):
+    """Listing representation: attachment metadata only, fields selectable"""
+    id: Optional[str] = None
+    question: Optional[str] = None
+    answer: Optional[str] = None
+    category: Optional[str] = None
+    tags: Optional[List[str]] = None
+    attachments: Optional[List[AttachmentSummary]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    rev: Optional[int] = None
 
 class Category(BaseModel):
     id: Optional[str] = None
@@ -88,6 +218,28 @@ class Category(BaseModel):
     description: Optional[str] = None
     created_at: Optional[datetime] = None
 
+class KnowledgePatch(BaseModel):
+    """JSON merge patch of an entry; attachments can also be added or removed one by one"""
+    question: Optional[str] = None
+    answer: Optional[str] = None
+    category: Optional[str] = None
+    tags: Optional[List[str]] = None
+    attachments: Optional[List[FileAttachment]] = None
+    add_attachments: List[FileAttachment] = []
+    remove_attachments: List[str] = []  # file ids
+    rev: Optional[int] = None  # expected revision, alternative to If-Match
+
+class BatchOperation(BaseModel):
+    op: str  # create, update, delete or move
+    id: Optional[str] = None
+    entry: Optional[KnowledgeEntry] = None  # create and update
+    category: Optional[str] = None  # move
+    rev: Optional[int] = None  # expected revision for update, delete and move
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+    ordered: bool = True
+
 class SearchQuery(BaseModel):
     query: str
     category: Optional[str] = None
@@ -101,6 +253,9 @@ class LoginResponse(BaseModel):
     token_type: str = "bearer"
     username: str
 
+class RevokeRequest(BaseModel):
+    token: str
+
 class DeleteResponse(BaseModel):
     message: str
     deleted_id: str
@@ -112,20 +267,35 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # jti identifies the token for revocation
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
+def decode_token(token: str) -> dict:
+    """Payload of a validly signed, unexpired token"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        return username
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return payload
+
+async def verify_token_payload(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Token payload, from the cache of verified tokens where possible"""
+    token = credentials.credentials
+    payload = verified_tokens.get(token)
+    if payload is None:
+        payload = decode_token(token)
+        verified_tokens.put(token, payload)
+    # Checked on cache hits too, revocations may come from other workers
+    if await revoked_tokens.is_revoked(token_id(token, payload)):
+        raise HTTPException(status_code=401, detail="Token wurde widerrufen")
+    return payload
+
+async def verify_token(payload: dict = Depends(verify_token_payload)) -> str:
+    return payload["sub"]
 
 # File handling functions
 def get_file_type(filename: str) -> str:
@@ -138,29 +308,25 @@ def get_file_type(filename: str) -> str:
     
     return 'other'
 
-def create_thumbnail(image_data: bytes, max_size: tuple = (200, 200)) -> str:
-    """Create thumbnail for image files"""
+async def create_renditions(sha256: str) -> Optional[Dict[str, Dict[str, str]]]:
+    """Render thumbnails of an image blob and store them; rendition keys by size and format"""
     try:
-        image = Image.open(io.BytesIO(image_data))
-        image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # Convert to RGB if necessary
-        if image.mode in ('RGBA', 'LA', 'P'):
-            image = image.convert('RGB')
-        
-        # Save as JPEG
-        thumb_io = io.BytesIO()
-        image.save(thumb_io, format='JPEG', quality=85)
-        thumb_io.seek(0)
-        
-        return base64.b64encode(thumb_io.getvalue()).decode('utf-8')
+        # Workers read the blob from disk where possible instead of receiving its bytes
+        source = blob_store.local_path(sha256) or await blob_store.get(sha256)
+        renditions = await thumbnail_renderer.render(source)
     except Exception as e:
         print(f"Error creating thumbnail: {e}")
         return None
+    
+    return {
+        size: {fmt: await blob_store.put(data, RENDITION_FORMATS[fmt][0]) for fmt, data in encoded.items()}
+        for size, encoded in renditions.items()
+    }
 
 def validate_file(file: UploadFile) -> bool:
     """Validate uploaded file"""
-    if file.size > MAX_FILE_SIZE:
+    # The request body is capped by BodySizeLimitMiddleware; the file part is checked while copying
+    if file.size is not None and file.size > MAX_FILE_SIZE:
         raise HTTPException(status_code=413, detail="Datei zu groß (max. 10MB)")
     
     extension = file.filename.lower().split('.')[-1]
@@ -171,6 +337,298 @@ def validate_file(file: UploadFile) -> bool:
     
     return True
 
+def validate_content(file_type: str, head: bytes) -> str:
+    """Check the sniffed content type of the first upload chunk and return it"""
+    sniffed = magic.from_buffer(head, mime=True)
+    if sniffed in BLOCKED_CONTENT_TYPES:
+        raise HTTPException(status_code=400, detail="Dateityp nicht unterstützt")
+    if file_type == 'images' and not sniffed.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Dateiinhalt passt nicht zum Dateityp")
+    return sniffed
+
+def http_date(value: Optional[datetime]) -> Optional[str]:
+    """HTTP date for a naive UTC datetime"""
+    if not value:
+        return None
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+def not_modified(request: Request, etag: str, modified: Optional[datetime]) -> bool:
+    """Whether If-None-Match / If-Modified-Since allow a 304 response"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # Weak comparison, If-Modified-Since is ignored when If-None-Match is present
+        opaque = lambda tag: tag[2:] if tag.startswith("W/") else tag
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or opaque(etag) in (opaque(tag) for tag in tags)
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+def revision_etag(rev: Optional[int]) -> str:
+    """ETag of an entry revision; weak, since gzip and identity responses share it"""
+    return f'W/"{rev}"'
+
+def expected_revision(request: Request, rev: Optional[int], body_rev: Optional[int] = None) -> Optional[int]:
+    """Revision a write is conditional on; 412 if If-Match (or ``rev`` in the body) names another one.
+
+    Without a precondition the current revision is returned all the same,
+    so the write still fails if the entry changes after it was read.
+    """
+    if_match = request.headers.get("if-match")
+    if if_match:
+        # The revision is what counts, so weak tags (as sent by GET) are accepted too
+        tags = [tag.strip().replace("W/", "", 1) for tag in if_match.split(",")]
+        if "*" not in tags and f'"{rev}"' not in tags:
+            raise HTTPException(status_code=412, detail="Eintrag wurde zwischenzeitlich geändert")
+    elif body_rev is not None and body_rev != rev:
+        raise HTTPException(status_code=412, detail="Eintrag wurde zwischenzeitlich geändert")
+    return rev
+
+async def revision_conflict(entry_id: str) -> HTTPException:
+    """Error for a conditional write that matched nothing"""
+    if not await storage.entries.exists(entry_id):
+        return HTTPException(status_code=404, detail="Eintrag nicht gefunden")
+    return HTTPException(status_code=412, detail="Eintrag wurde zwischenzeitlich geändert")
+
+def parse_range(header: str, size: int):
+    """(start, end) of a single "bytes=" range, end exclusive.
+
+    Returns None for headers that are ignored (syntax errors, multiple ranges)
+    and "unsatisfiable" if the range lies outside the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return "unsatisfiable"
+            return max(0, size - length), size
+        start = int(first)
+        end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if start >= size:
+        return "unsatisfiable"
+    if end <= start:
+        return None
+    return start, min(end, size)
+
+async def store_attachments(attachments: List[FileAttachment]):
+    """Move inline payloads into the blob store and check blob references"""
+    written = []
+    for attachment in attachments:
+        if not attachment.id:
+            attachment.id = str(uuid.uuid4())
+        if attachment.file_data:
+            file_content = base64.b64decode(attachment.file_data)
+            attachment.sha256 = await blob_store.put(file_content, attachment.content_type)
+            attachment.file_size = len(file_content)
+            attachment.file_data = None
+            if attachment.file_type == 'images':
+                attachment.thumbnails = await create_renditions(attachment.sha256)
+            written.append(attachment)
+        elif not attachment.sha256 or not await blob_store.exists(attachment.sha256):
+            raise HTTPException(status_code=400, detail=f"Datei '{attachment.filename}' nicht gefunden")
+        elif attachment.file_type == 'images' and not attachment.thumbnails:
+            # Listings return attachments without rendition keys; keep the catalogued ones or render again
+            stored = await storage.files.get(attachment.id)
+            if stored and stored.get("sha256") == attachment.sha256 and stored.get("thumbnails"):
+                attachment.thumbnails = stored["thumbnails"]
+                attachment.thumbnail = attachment.thumbnail or stored.get("thumbnail")
+            else:
+                attachment.thumbnails = await create_renditions(attachment.sha256)
+                written.append(attachment)
+        if not attachment.uploaded_at:
+            attachment.uploaded_at = datetime.utcnow()
+    # Another entry sharing these blobs may be deleted before this one is catalogued
+    await storage.files.hold_blobs(key for attachment in written for key in attachment_blobs(attachment.dict()))
+
+async def release_blobs(keys: Set[str]):
+    """Delete blobs (files and renditions) that no catalogued attachment refers to any more"""
+    for key in keys:
+        await blob_store.delete(key)
+
+def attachment_documents(attachments: List[FileAttachment]) -> List[dict]:
+    """Stored form of attachments, without inline payload bytes"""
+    return [attachment.dict(exclude={"file_data"}) for attachment in attachments]
+
+def entry_document(entry: KnowledgeEntry) -> dict:
+    """Mongo document for an entry, without any inline payload bytes"""
+    return entry.dict(exclude={"attachments": {"__all__": {"file_data"}}})
+
+def index_entry(document: dict):
+    search_index.add(document)
+    suggest_index.add(document)
+
+def unindex_entry(entry_id: str):
+    search_index.remove(entry_id)
+    suggest_index.remove(entry_id)
+
+def summary_projection(fields: Optional[str] = None) -> dict:
+    """Mongo projection for the summary representation, never loading payloads"""
+    if not fields:
+        return {"_id": 0, "attachments.file_data": 0, "attachments.thumbnail": 0}
+    
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in SUMMARY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unbekannte Felder: {', '.join(unknown)}")
+    
+    projection = {"_id": 0, "id": 1}
+    for field in selected:
+        if field == "attachments":
+            projection.update({f"attachments.{name}": 1 for name in ATTACHMENT_SUMMARY_FIELDS})
+        else:
+            projection[field] = 1
+    return projection
+
+def summary_document(entry: dict) -> dict:
+    """Summary fields of a projected document as plain data, linking image thumbnails by URL"""
+    summary = {field: entry[field] for field in SUMMARY_FIELDS if field in entry}
+    if summary.get("attachments") is not None:
+        attachments = []
+        for attachment in summary["attachments"]:
+            item = {field: attachment[field] for field in ATTACHMENT_SUMMARY_FIELDS if field in attachment}
+            if attachment.get("file_type") == "images" and attachment.get("id"):
+                urls = {str(size): f"/api/files/{attachment['id']}/thumbnail/{size}" for size in RENDITION_SIZES}
+                item["thumbnail_url"] = urls[str(DEFAULT_THUMBNAIL_SIZE)]
+                item["thumbnail_urls"] = urls
+            attachments.append(item)
+        summary["attachments"] = attachments
+    return summary
+
+def entry_summary(entry: dict) -> KnowledgeEntrySummary:
+    """Summary model from a projected document"""
+    return KnowledgeEntrySummary(**summary_document(entry))
+
+def entry_summaries(entries: List[dict]) -> list:
+    """Response items: plain documents with FAST_JSON, validated summary models otherwise"""
+    if FAST_JSON:
+        return [summary_document(entry) for entry in entries]
+    return [entry_summary(entry) for entry in entries]
+
+def encode_json(content, **encode_options) -> bytes:
+    """Compact UTF-8 JSON, via orjson when FAST_JSON is enabled"""
+    if FAST_JSON:
+        # Models left in the content go through the regular encoder
+        return orjson.dumps(content, default=lambda value: jsonable_encoder(value, **encode_options))
+    content = jsonable_encoder(content, **encode_options)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def encode_cursor(values: list) -> str:
+    """Opaque pagination cursor from the sort key of the last returned item"""
+    raw = json.dumps(values, default=lambda value: value.isoformat(), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, types: tuple) -> tuple:
+    """Sort key from a cursor, converted to the given types"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(types):
+            raise ValueError(cursor)
+        return tuple(
+            datetime.fromisoformat(value) if value_type is datetime else value_type(value)
+            for value, value_type in zip(values, types)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Ungültiger Cursor")
+
+def page_size(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def set_next_page(request: Request, headers, cursor: Optional[str]):
+    """Advertise the next page via Link and X-Next-Cursor headers"""
+    if cursor:
+        next_url = request.url.include_query_params(cursor=cursor)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+        headers["X-Next-Cursor"] = cursor
+
+async def cached_json(
+    request: Request,
+    build,
+    variant: str = "",
+    version: Optional[str] = None,
+    etag: Optional[str] = None,
+    **encode_options
+) -> Response:
+    """JSON response from the response cache, built and stored on a miss.
+    
+    ``build(headers)`` returns the response content and may add headers;
+    hits return the stored bytes without querying or validating anything.
+    ``variant`` tells apart responses beyond path and query, e.g. by body.
+    ``version`` defaults to the content version, which for GET doubles as
+    weak ETag unless ``etag`` is given, so revalidations that still match
+    get a 304 before any of that. Compressed bodies are cached next to the
+    plain one, so each coding is produced once per version.
+    """
+    version = version or await storage.content_version()
+    validators = {"Vary": "Accept-Encoding"}
+    if request.method == "GET":
+        validators.update({"ETag": etag or f'W/"{version}"', "Cache-Control": "no-cache"})
+        if not_modified(request, validators["ETag"], None):
+            return Response(status_code=304, headers=validators)
+    coding = negotiate(request.headers.get("accept-encoding", ""))
+    
+    key = None
+    cached = None
+    if response_cache is not None:
+        query = urlencode(sorted(request.query_params.multi_items()))
+        key = f"{version}:{request.url.netloc}{request.url.path}?{query}#{variant}"
+        if coding is not None:
+            compressed = await response_cache.get(f"{key}|{coding}")
+            if compressed is not None:
+                body, headers = compressed
+                return Response(content=body, media_type="application/json", headers={**headers, **validators})
+        cached = await response_cache.get(key)
+    
+    if cached is not None:
+        body, headers = cached
+    else:
+        headers = {}
+        body = encode_json(await build(headers), **encode_options)
+        if key is not None:
+            await response_cache.set(key, body, headers)
+    
+    if coding is not None and len(body) >= COMPRESSION_MIN_SIZE:
+        body = compress(body, coding)
+        headers = {**headers, "Content-Encoding": coding}
+        if key is not None:
+            await response_cache.set(f"{key}|{coding}", body, headers)
+    return Response(content=body, media_type="application/json", headers={**headers, **validators})
+
+async def find_entries_page(category: Optional[str], projection: dict, limit: int, cursor: Optional[str]):
+    """Newest entries first, continuing after the (created_at, id) key in the cursor"""
+    after = decode_cursor(cursor, (datetime, str)) if cursor else None
+    
+    # Inclusion projections need the sort key for the cursor, but not in the output
+    sort_fields = []
+    if projection.get("id") == 1 and "created_at" not in projection:
+        projection = dict(projection, created_at=1)
+        sort_fields.append("created_at")
+    
+    entries = await storage.entries.list_page(category, after, limit + 1, projection)
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor([entries[-1]["created_at"], entries[-1]["id"]])
+    for entry in entries:
+        for field in sort_fields:
+            entry.pop(field, None)
+    return entries, next_cursor
+
 # API Routes
 @app.get("/api/health")
 async def health_check():
@@ -188,182 +646,375 @@ async def admin_login(login_request: LoginRequest):
     access_token = create_access_token(data={"sub": username})
     return LoginResponse(access_token=access_token, username=username)
 
+@app.post("/api/admin/logout")
+async def admin_logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    payload: dict = Depends(verify_token_payload)
+):
+    """Abmelden - das verwendete Token ist danach bis zu seinem Ablauf gesperrt"""
+    await revoked_tokens.revoke(token_id(credentials.credentials, payload), payload["exp"])
+    verified_tokens.discard(credentials.credentials)
+    return {"message": "Erfolgreich abgemeldet"}
+
+@app.post("/api/admin/revoke")
+async def revoke_token(revoke_request: RevokeRequest, current_user: str = Depends(verify_token)):
+    """Ein anderes (z.B. kompromittiertes) Token sperren"""
+    try:
+        payload = jwt.decode(revoke_request.token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        return {"message": "Token ist bereits abgelaufen"}
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=400, detail="Ungültiges Token")
+    await revoked_tokens.revoke(token_id(revoke_request.token, payload), payload["exp"])
+    verified_tokens.discard(revoke_request.token)
+    return {"message": "Token wurde gesperrt"}
+
 @app.get("/api/admin/verify")
 async def verify_admin(current_user: str = Depends(verify_token)):
     """Token verifizieren"""
     return {"valid": True, "username": current_user}
 
+@app.get("/api/admin/index-stats")
+async def get_index_stats(current_user: str = Depends(verify_token)):
+    """Index-Nutzung ($indexStats) für die abgefragten Collections"""
+    return await storage.index_usage()
+
 @app.post("/api/upload", response_model=FileAttachment)
 async def upload_file(file: UploadFile = File(...), current_user: str = Depends(verify_token)):
     """Datei hochladen - nur für Admins"""
     validate_file(file)
+    file_type = get_file_type(file.filename)
     
-    # Read file content
-    file_content = await file.read()
-    file_data = base64.b64encode(file_content).decode('utf-8')
+    # The form parser has spooled the file (in memory up to 1 MB, beyond that
+    # on disk); copy it into the blob store chunk by chunk, hashing on the way
+    head = await file.read(UPLOAD_CHUNK_SIZE)
+    sniffed_type = validate_content(file_type, head)
+    content_type = file.content_type
+    if not content_type or content_type == "application/octet-stream":
+        content_type = sniffed_type
     
-    # Create thumbnail for images
-    thumbnail = None
-    file_type = get_file_type(file.filename)
+    async with blob_store.writer(content_type) as writer:
+        chunk = head
+        while chunk:
+            if writer.size + len(chunk) > MAX_FILE_SIZE:
+                raise HTTPException(status_code=413, detail="Datei zu groß (max. 10MB)")
+            await writer.write(chunk)
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        sha256 = await writer.commit()
+    
+    # Thumbnails are rendered off the event loop and stored as blobs
+    thumbnails = None
     if file_type == 'images':
-        thumbnail = create_thumbnail(file_content)
+        thumbnails = await create_renditions(sha256)
     
     # Create file attachment
     attachment = FileAttachment(
         id=str(uuid.uuid4()),
         filename=file.filename,
         file_type=file_type,
-        file_size=len(file_content),
-        content_type=file.content_type,
-        file_data=file_data,
-        thumbnail=thumbnail,
+        file_size=writer.size,
+        content_type=content_type,
+        sha256=sha256,
+        thumbnails=thumbnails,
         uploaded_at=datetime.utcnow()
     )
+    # Referenced by no entry until one is saved with it
+    await storage.files.hold_blobs(attachment_blobs(attachment.dict()))
     
     return attachment
 
 @app.get("/api/files/{file_id}/download")
-async def download_file(file_id: str):
-    """Datei herunterladen"""
-    # Find file in knowledge entries
-    entry = knowledge_base.find_one({"attachments.id": file_id})
-    if not entry:
+async def download_file(file_id: str, request: Request):
+    """Datei herunterladen (unterstützt Range- und bedingte Anfragen)"""
+    attachment = await storage.files.get(file_id)
+    if not attachment or not attachment.get("sha256"):
         raise HTTPException(status_code=404, detail="Datei nicht gefunden")
     
-    # Find specific attachment
-    attachment = None
-    for att in entry.get("attachments", []):
-        if att.get("id") == file_id:
-            attachment = att
-            break
-    
-    if not attachment:
+    sha256 = attachment["sha256"]
+    try:
+        size = await blob_store.size(sha256)
+    except BlobNotFound:
         raise HTTPException(status_code=404, detail="Datei nicht gefunden")
     
-    # Decode file data
-    file_data = base64.b64decode(attachment["file_data"])
+    etag = f'"{sha256}"'
+    last_modified = http_date(attachment.get("uploaded_at"))
+    headers = {
+        "Content-Disposition": f"attachment; filename={attachment['filename']}",
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "public, max-age=86400",
+    }
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    
+    if not_modified(request, etag, attachment.get("uploaded_at")):
+        return Response(status_code=304, headers=headers)
+    
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if request.headers.get("range") and (not if_range or if_range in (etag, last_modified)):
+        byte_range = parse_range(request.headers["range"], size)
+        if byte_range == "unsatisfiable":
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+    
+    start, end = byte_range or (0, size)
+    headers["Content-Length"] = str(end - start)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
     
-    # Create response
     return StreamingResponse(
-        io.BytesIO(file_data),
+        blob_store.iter_range(sha256, start, end),
+        status_code=206 if byte_range else 200,
         media_type=attachment["content_type"],
-        headers={"Content-Disposition": f"attachment; filename={attachment['filename']}"}
+        headers=headers
     )
 
+def accepted_format(request: Request, available: Dict[str, str]) -> str:
+    """Preferred rendition format the client accepts; JPEG as fallback"""
+    accept = request.headers.get("accept", "")
+    for fmt in RENDITION_FORMATS:
+        if fmt in available and (fmt == "jpeg" or RENDITION_FORMATS[fmt][0] in accept):
+            return fmt
+    return next(iter(available))
+
+@app.get("/api/files/{file_id}/thumbnail/{size}")
+async def get_thumbnail_rendition(file_id: str, size: int, request: Request):
+    """Vorschaubild eines Bildanhangs in 64, 200 oder 800 Pixel abrufen"""
+    attachment = await storage.files.get(file_id)
+    if not attachment or size not in RENDITION_SIZES:
+        raise HTTPException(status_code=404, detail="Vorschaubild nicht gefunden")
+    
+    renditions = (attachment.get("thumbnails") or {}).get(str(size))
+    if not renditions:
+        # Attachments from before renditions only have one Base64 thumbnail
+        if not attachment.get("thumbnail"):
+            raise HTTPException(status_code=404, detail="Vorschaubild nicht gefunden")
+        return Response(
+            content=base64.b64decode(attachment["thumbnail"]),
+            media_type="image/jpeg",
+            headers={"Cache-Control": "public, max-age=86400"}
+        )
+    
+    fmt = accepted_format(request, renditions)
+    key = renditions[fmt]
+    # Rendition blobs never change, so the URL can be cached for good
+    headers = {
+        "ETag": f'"{key}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept",
+    }
+    if not_modified(request, headers["ETag"], None):
+        return Response(status_code=304, headers=headers)
+    try:
+        content = await blob_store.get(key)
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Vorschaubild nicht gefunden")
+    return Response(content=content, media_type=RENDITION_FORMATS[fmt][0], headers=headers)
+
+@app.get("/api/files/{file_id}/image")
+async def get_image(
+    file_id: str,
+    request: Request,
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    fmt: Optional[str] = None
+):
+    """Bildanhang in beliebiger Größe abrufen (wird bei Bedarf erzeugt und zwischengespeichert)"""
+    if not w and not h:
+        raise HTTPException(status_code=400, detail="Breite (w) oder Höhe (h) angeben")
+    if any(value is not None and not 0 < value <= MAX_IMAGE_DIMENSION for value in (w, h)):
+        raise HTTPException(status_code=400, detail=f"Breite und Höhe müssen zwischen 1 und {MAX_IMAGE_DIMENSION} liegen")
+    formats = available_formats()
+    if fmt is not None and fmt not in formats:
+        raise HTTPException(status_code=400, detail=f"Format nicht unterstützt (erlaubt: {', '.join(formats)})")
+    
+    attachment = await storage.files.get(file_id)
+    if not attachment or attachment.get("file_type") != "images" or not attachment.get("sha256"):
+        raise HTTPException(status_code=404, detail="Bild nicht gefunden")
+    
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    if fmt is None:
+        fmt = accepted_format(request, dict.fromkeys(formats))
+        headers["Vary"] = "Accept"
+    sha256 = attachment["sha256"]
+    cache_key = f"{sha256}:{w or ''}x{h or ''}.{fmt}"
+    headers["ETag"] = f'"{hashlib.sha256(cache_key.encode("utf-8")).hexdigest()}"'
+    if not_modified(request, headers["ETag"], None):
+        return Response(status_code=304, headers=headers)
+    
+    async def resize() -> bytes:
+        source = blob_store.local_path(sha256) or await blob_store.get(sha256)
+        return await thumbnail_renderer.resize(source, w, h, fmt)
+    
+    try:
+        content = await image_cache.get_or_create(cache_key, resize)
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Bild nicht gefunden")
+    except Exception as e:
+        print(f"Error resizing image: {e}")
+        raise HTTPException(status_code=422, detail="Bild konnte nicht verarbeitet werden")
+    return Response(content=content, media_type=RENDITION_FORMATS[fmt][0], headers=headers)
+
+@app.get("/api/files/{file_id}/thumbnail")
+async def get_thumbnail(file_id: str, request: Request):
+    """Vorschaubild eines Bildanhangs abrufen (200 Pixel)"""
+    return await get_thumbnail_rendition(file_id, DEFAULT_THUMBNAIL_SIZE, request)
+
 @app.post("/api/knowledge", response_model=KnowledgeEntry)
 async def create_knowledge_entry(entry: KnowledgeEntry, current_user: str = Depends(verify_token)):
     """Neue Frage/Antwort hinzufügen - nur für Admins"""
     entry.id = str(uuid.uuid4())
     entry.created_at = datetime.utcnow()
     entry.updated_at = datetime.utcnow()
+    entry.rev = 1
     
-    # Ensure all attachments have proper timestamps
-    for attachment in entry.attachments:
-        if not attachment.uploaded_at:
-            attachment.uploaded_at = datetime.utcnow()
+    # Store payloads in the blob store and set attachment timestamps
+    await store_attachments(entry.attachments)
     
-    knowledge_base.insert_one(entry.dict())
+    document = entry_document(entry)
+    await storage.entries.insert(document)
+    await storage.files.set_for_entry(entry.id, document["attachments"])
+    await storage.stats.apply(counter_delta(None, document))
+    await storage.bump_content_version()
+    index_entry(document)
     return entry
 
-@app.get("/api/knowledge", response_model=List[KnowledgeEntry])
-async def get_all_knowledge(category: Optional[str] = None, limit: int = 100):
-    """Alle Wissenseinträge abrufen - öffentlich"""
-    query = {}
-    if category:
-        query["category"] = category
-    
-    entries = list(knowledge_base.find(query).sort("created_at", -1).limit(limit))
-    result = []
+@app.get("/api/knowledge", response_model=List[KnowledgeEntrySummary], response_model_exclude_unset=True)
+async def get_all_knowledge(
+    request: Request,
+    category: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Wissenseinträge seitenweise abrufen (Zusammenfassung) - öffentlich"""
+    async def build(headers):
+        entries, next_cursor = await find_entries_page(category, summary_projection(fields), page_size(limit), cursor)
+        set_next_page(request, headers, next_cursor)
+        return entry_summaries(entries)
     
-    for entry in entries:
-        entry["_id"] = str(entry["_id"])
-        result.append(KnowledgeEntry(**entry))
-    
-    return result
-
-@app.post("/api/search", response_model=List[KnowledgeEntry])
-async def search_knowledge(search_query: SearchQuery):
-    """Wissensdatenbank durchsuchen - öffentlich"""
-    query = {}
-    
-    if search_query.query:
-        search_pattern = re.compile(search_query.query, re.IGNORECASE)
-        query["$or"] = [
-            {"question": {"$regex": search_pattern}},
-            {"answer": {"$regex": search_pattern}},
-            {"tags": {"$regex": search_pattern}}
-        ]
+    return await cached_json(request, build, exclude_unset=True)
+
+@app.get("/api/knowledge/{entry_id}", response_model=KnowledgeEntry)
+async def get_knowledge_entry(entry_id: str, request: Request):
+    """Einzelnen Wissenseintrag mit allen Details abrufen - öffentlich"""
+    # The revision is the ETag and, with the change time, the cache version of the entry
+    current = await storage.entries.get(entry_id, {"rev": 1, "updated_at": 1})
+    if not current:
+        raise HTTPException(status_code=404, detail="Eintrag nicht gefunden")
     
-    if search_query.category:
-        query["category"] = search_query.category
+    async def build(headers: dict):
+        entry = await storage.entries.get(entry_id, {"attachments.file_data": 0})
+        if not entry:
+            raise HTTPException(status_code=404, detail="Eintrag nicht gefunden")
+        return KnowledgeEntry(**entry)
     
-    entries = list(knowledge_base.find(query).sort("created_at", -1))
-    result = []
+    version = f"rev{current.get('rev')}:{current.get('updated_at')}"
+    return await cached_json(request, build, version=version, etag=revision_etag(current.get("rev")))
+
+@app.post("/api/search", response_model=List[KnowledgeEntrySummary], response_model_exclude_unset=True)
+async def search_knowledge(
+    search_query: SearchQuery,
+    request: Request,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Wissensdatenbank seitenweise durchsuchen (nach Relevanz sortiert) - öffentlich"""
+    limit = page_size(limit)
     
-    for entry in entries:
-        entry["_id"] = str(entry["_id"])
-        result.append(KnowledgeEntry(**entry))
+    async def build(headers):
+        if search_query.query.strip():
+            after = decode_cursor(cursor, (float, datetime, str)) if cursor else None
+            hits = search_index.search(search_query.query, category=search_query.category or None, limit=limit + 1, after=after)
+            next_cursor = None
+            if len(hits) > limit:
+                hits = hits[:limit]
+                next_cursor = encode_cursor(list(search_index.rank_key(*hits[-1])))
+            
+            entry_ids = [entry_id for entry_id, _ in hits]
+            entries = {entry["id"]: entry for entry in await storage.entries.get_many(entry_ids, summary_projection(fields))}
+            entries = [entries[entry_id] for entry_id in entry_ids if entry_id in entries]
+        else:
+            entries, next_cursor = await find_entries_page(search_query.category, summary_projection(fields), limit, cursor)
+        
+        set_next_page(request, headers, next_cursor)
+        return entry_summaries(entries)
     
-    return result
+    # Results come from this worker's index, which may trail the database; keyed by its
+    # contents, workers only share results of indexes that agree
+    index_state = search_index.fingerprint if search_query.query.strip() else ""
+    variant = json.dumps([search_query.query, search_query.category, index_state], ensure_ascii=False)
+    return await cached_json(request, build, variant=variant, exclude_unset=True)
+
+@app.get("/api/search/suggest")
+async def suggest(q: str, limit: int = 8):
+    """Vorschläge während der Eingabe (Präfix- und Tippfehlersuche) - öffentlich"""
+    limit = max(1, min(limit, MAX_SUGGESTIONS))
+    return {"query": q, "suggestions": suggest_index.suggest(q, limit)}
 
 @app.post("/api/categories", response_model=Category)
 async def create_category(category: Category, current_user: str = Depends(verify_token)):
     """Neue Kategorie hinzufügen - nur für Admins"""
-    existing_category = categories_collection.find_one({"name": category.name})
+    existing_category = await storage.categories.get_by_name(category.name)
     if existing_category:
         raise HTTPException(status_code=400, detail="Kategorie existiert bereits")
     
     category.id = str(uuid.uuid4())
     category.created_at = datetime.utcnow()
     
-    categories_collection.insert_one(category.dict())
+    await storage.categories.insert(category.dict())
+    await storage.bump_content_version()
+    suggest_index.add_category(category.name)
     return category
 
 @app.get("/api/categories")
-async def get_categories():
+async def get_categories(request: Request):
     """Verfügbare Kategorien abrufen - öffentlich"""
-    knowledge_categories = knowledge_base.distinct("category")
-    custom_categories = list(categories_collection.find({}))
-    
-    all_categories = set(knowledge_categories)
-    for cat in custom_categories:
-        all_categories.add(cat["name"])
+    async def build(headers):
+        overview = await storage.category_overview()
+        return {
+            "categories": [category["name"] for category in overview],
+            "items": overview
+        }
     
-    return {"categories": list(all_categories)}
+    return await cached_json(request, build)
 
 @app.get("/api/categories/detailed", response_model=List[Category])
-async def get_detailed_categories(current_user: str = Depends(verify_token)):
+async def get_detailed_categories(request: Request, current_user: str = Depends(verify_token)):
     """Detaillierte Kategorien für Admin-Interface"""
-    categories = list(categories_collection.find({}))
-    result = []
-    
-    for cat in categories:
-        cat["_id"] = str(cat["_id"])
-        result.append(Category(**cat))
+    async def build(headers):
+        categories = await storage.categories.list_all()
+        return [Category(**cat) for cat in categories]
     
-    return result
+    return await cached_json(request, build)
 
 @app.delete("/api/categories/{category_id}", response_model=DeleteResponse)
 async def delete_category(category_id: str, current_user: str = Depends(verify_token)):
     """Kategorie löschen - nur für Admins"""
-    category = categories_collection.find_one({"id": category_id})
+    category = await storage.categories.get(category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Kategorie nicht gefunden")
     
     category_name = category["name"]
     
     # Einträge mit dieser Kategorie auf "Allgemein" umstellen
-    entries_using_category = knowledge_base.count_documents({"category": category_name})
+    affected_entries = await storage.entries.find_by_category(category_name, SEARCH_INDEX_PROJECTION)
+    entries_using_category = len(affected_entries)
     if entries_using_category > 0:
-        knowledge_base.update_many(
-            {"category": category_name},
-            {"$set": {"category": "Allgemein"}}
-        )
+        moved = await storage.entries.recategorize(category_name, "Allgemein", datetime.utcnow())
+        await storage.stats.apply({f"category:{category_name}": -moved, "category:Allgemein": moved})
+        for affected_entry in affected_entries:
+            affected_entry["category"] = "Allgemein"
+            index_entry(affected_entry)
     
     # Kategorie löschen
-    result = categories_collection.delete_one({"id": category_id})
-    if result.deleted_count == 0:
+    deleted = await storage.categories.delete(category_id)
+    await storage.bump_content_version()
+    if not deleted:
         raise HTTPException(status_code=404, detail="Kategorie nicht gefunden")
+    suggest_index.remove_category(category_name)
     
     return DeleteResponse(
         message=f"Kategorie '{category_name}' erfolgreich gelöscht. {entries_using_category} Einträge wurden auf 'Allgemein' umgestellt.",
@@ -371,53 +1022,417 @@ async def delete_category(category_id: str, current_user: str = Depends(verify_t
     )
 
 @app.get("/api/stats")
-async def get_stats():
+async def get_stats(request: Request):
     """Statistiken abrufen - öffentlich"""
-    total_entries = knowledge_base.count_documents({})
-    categories_count = len(knowledge_base.distinct("category"))
-    
-    # Count total attachments
-    total_attachments = 0
-    for entry in knowledge_base.find({}, {"attachments": 1}):
-        total_attachments += len(entry.get("attachments", []))
+    async def build(headers):
+        return stats_view(await storage.stats.get_all())
     
-    return {
-        "total_entries": total_entries,
-        "categories_count": categories_count,
-        "total_attachments": total_attachments
-    }
+    return await cached_json(request, build)
 
 @app.put("/api/knowledge/{entry_id}", response_model=KnowledgeEntry)
-async def update_knowledge_entry(entry_id: str, entry: KnowledgeEntry, current_user: str = Depends(verify_token)):
-    """Wissenseintrag aktualisieren - nur für Admins"""
-    existing_entry = knowledge_base.find_one({"id": entry_id})
+async def update_knowledge_entry(
+    entry_id: str,
+    entry: KnowledgeEntry,
+    request: Request,
+    response: Response,
+    current_user: str = Depends(verify_token)
+):
+    """Wissenseintrag aktualisieren (bedingt per If-Match oder rev) - nur für Admins"""
+    existing_entry = await storage.entries.get(entry_id, dict(STATS_PROJECTION, created_at=1, rev=1))
     if not existing_entry:
         raise HTTPException(status_code=404, detail="Eintrag nicht gefunden")
+    rev = expected_revision(request, existing_entry.get("rev"), entry.rev)
     
     entry.id = entry_id
+    entry.created_at = existing_entry.get("created_at")
     entry.updated_at = datetime.utcnow()
+    entry.rev = (rev or 0) + 1
+    await store_attachments(entry.attachments)
     
-    knowledge_base.replace_one({"id": entry_id}, entry.dict())
+    document = entry_document(entry)
+    if not await storage.entries.replace(entry_id, document, rev=rev):
+        raise await revision_conflict(entry_id)
+    await release_blobs(await storage.files.set_for_entry(entry_id, document["attachments"]))
+    await storage.stats.apply(counter_delta(existing_entry, document))
+    await storage.bump_content_version()
+    index_entry(document)
+    response.headers["ETag"] = revision_etag(entry.rev)
     return entry
 
-@app.delete("/api/knowledge/{entry_id}", response_model=DeleteResponse)
-async def delete_knowledge_entry(entry_id: str, current_user: str = Depends(verify_token)):
-    """Wissenseintrag löschen - nur für Admins"""
-    entry = knowledge_base.find_one({"id": entry_id})
-    if not entry:
+@app.patch("/api/knowledge/{entry_id}", response_model=KnowledgeEntry)
+async def patch_knowledge_entry(
+    entry_id: str,
+    patch: KnowledgePatch,
+    request: Request,
+    response: Response,
+    current_user: str = Depends(verify_token)
+):
+    """Einzelne Felder eines Wissenseintrags ändern (JSON Merge Patch, bedingt per If-Match oder rev) - nur für Admins"""
+    changes = patch.dict(exclude_unset=True, exclude={"attachments", "add_attachments", "remove_attachments", "rev"})
+    for field in ("question", "answer", "category"):
+        if field in changes and changes[field] is None:
+            raise HTTPException(status_code=400, detail=f"Feld '{field}' darf nicht entfernt werden")
+    if "attachments" in patch.__fields_set__ and (patch.add_attachments or patch.remove_attachments):
+        raise HTTPException(status_code=400, detail="'attachments' kann nicht mit 'add_attachments'/'remove_attachments' kombiniert werden")
+    
+    # Adding and removing at once rewrites the list, so it needs the full attachment documents
+    replace_attachments = bool(patch.add_attachments and patch.remove_attachments)
+    if replace_attachments:
+        projection = {"_id": 0, "id": 1, "category": 1, "rev": 1, "attachments": 1}
+    else:
+        projection = dict(STATS_PROJECTION, rev=1, **{"attachments.id": 1})
+    existing_entry = await storage.entries.get(entry_id, projection)
+    if not existing_entry:
         raise HTTPException(status_code=404, detail="Eintrag nicht gefunden")
+    rev = expected_revision(request, existing_entry.get("rev"), patch.rev)
+    existing_ids = {attachment.get("id") for attachment in existing_entry.get("attachments", [])}
+    missing = [file_id for file_id in patch.remove_attachments if file_id not in existing_ids]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Anhang nicht gefunden: {', '.join(missing)}")
+    
+    update = {"$set": {field: value for field, value in changes.items() if value is not None}, "$inc": {"rev": 1}}
+    update["$set"]["updated_at"] = datetime.utcnow()
+    unset = {field: "" for field, value in changes.items() if value is None}
+    if unset:
+        update["$unset"] = unset
+    if "attachments" in patch.__fields_set__:
+        await store_attachments(patch.attachments or [])
+        update["$set"]["attachments"] = attachment_documents(patch.attachments or [])
+    if patch.add_attachments:
+        await store_attachments(patch.add_attachments)
+    if replace_attachments:
+        # MongoDB cannot push to and pull from the same array in one update; the
+        # revision condition makes sure the list read above is still current
+        kept = [attachment for attachment in existing_entry.get("attachments", []) if attachment.get("id") not in patch.remove_attachments]
+        update["$set"]["attachments"] = kept + attachment_documents(patch.add_attachments)
+    elif patch.add_attachments:
+        update["$push"] = {"attachments": {"$each": attachment_documents(patch.add_attachments)}}
+    elif patch.remove_attachments:
+        update["$pull"] = {"attachments": {"id": {"$in": patch.remove_attachments}}}
     
-    result = knowledge_base.delete_one({"id": entry_id})
-    if result.deleted_count == 0:
+    document = await storage.entries.update(entry_id, update, EXPORT_PROJECTION, rev=rev)
+    if document is None:
+        raise await revision_conflict(entry_id)
+    if "attachments" in patch.__fields_set__ or patch.add_attachments or patch.remove_attachments:
+        await release_blobs(await storage.files.set_for_entry(entry_id, document.get("attachments", [])))
+    await storage.stats.apply(counter_delta(existing_entry, document))
+    await storage.bump_content_version()
+    index_entry(document)
+    response.headers["ETag"] = revision_etag(document.get("rev"))
+    return KnowledgeEntry(**document)
+
+@app.delete("/api/knowledge/{entry_id}", response_model=DeleteResponse)
+async def delete_knowledge_entry(entry_id: str, request: Request, current_user: str = Depends(verify_token)):
+    """Wissenseintrag löschen (bedingt per If-Match) - nur für Admins"""
+    existing_entry = await storage.entries.get(entry_id, dict(STATS_PROJECTION, rev=1))
+    if not existing_entry:
         raise HTTPException(status_code=404, detail="Eintrag nicht gefunden")
+    rev = expected_revision(request, existing_entry.get("rev"))
+    if not await storage.entries.delete(entry_id, rev=rev):
+        raise await revision_conflict(entry_id)
+    await release_blobs(await storage.files.delete_for_entry(entry_id))
+    await storage.stats.apply(counter_delta(existing_entry, None))
+    await storage.bump_content_version()
+    unindex_entry(entry_id)
     
     return DeleteResponse(message="Eintrag erfolgreich gelöscht", deleted_id=entry_id)
 
+async def plan_batch_operation(operation: BatchOperation, state: Dict[str, Optional[dict]], now: datetime):
+    """Storage operation and resulting document for one batch item, checked against the batch state"""
+    if operation.op == "create":
+        if operation.entry is None:
+            raise HTTPException(status_code=400, detail="'entry' fehlt")
+        entry = operation.entry
+        entry.id = entry.id or str(uuid.uuid4())
+        if state.get(entry.id) is not None:
+            raise HTTPException(status_code=409, detail="Eintrag existiert bereits")
+        entry.created_at = now
+        entry.updated_at = now
+        entry.rev = 1
+        await store_attachments(entry.attachments)
+        document = entry_document(entry)
+        return {"type": "insert", "entry": document}, document
+    
+    if operation.op not in ("update", "delete", "move"):
+        raise HTTPException(status_code=400, detail=f"Unbekannte Operation: {operation.op}")
+    if not operation.id:
+        raise HTTPException(status_code=400, detail="'id' fehlt")
+    existing_entry = state.get(operation.id)
+    if existing_entry is None:
+        raise HTTPException(status_code=404, detail="Eintrag nicht gefunden")
+    expected_rev = operation.rev if operation.rev is not None or operation.entry is None else operation.entry.rev
+    if expected_rev is not None and expected_rev != existing_entry.get("rev"):
+        raise HTTPException(status_code=412, detail="Eintrag wurde zwischenzeitlich geändert")
+    # Written only if the entry is still as read (or written) for this batch; the
+    # change time tells writes of this batch from others that reached the same rev
+    target = {"id": operation.id, "condition": {"rev": existing_entry.get("rev"), "updated_at": existing_entry.get("updated_at")}}
+    rev = (existing_entry.get("rev") or 0) + 1
+    
+    if operation.op == "delete":
+        return dict(target, type="delete"), None
+    if operation.op == "move":
+        if not operation.category:
+            raise HTTPException(status_code=400, detail="'category' fehlt")
+        changes = {"category": operation.category, "updated_at": now}
+        update = {"$set": changes, "$inc": {"rev": 1}}
+        return dict(target, type="update", update=update), dict(existing_entry, rev=rev, **changes)
+    
+    if operation.entry is None:
+        raise HTTPException(status_code=400, detail="'entry' fehlt")
+    entry = operation.entry
+    entry.id = operation.id
+    entry.created_at = existing_entry.get("created_at")
+    entry.updated_at = now
+    entry.rev = rev
+    await store_attachments(entry.attachments)
+    document = entry_document(entry)
+    return dict(target, type="update", update={"$set": document}), document
+
+@app.post("/api/knowledge/batch")
+async def batch_knowledge(batch: BatchRequest, current_user: str = Depends(verify_token)):
+    """Mehrere Einträge in einem Aufruf anlegen, ändern, löschen oder verschieben - nur für Admins"""
+    if len(batch.operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"Höchstens {MAX_BATCH_OPERATIONS} Operationen pro Aufruf")
+    now = datetime.utcnow()
+    
+    # Current documents of all referenced entries in one query, updated as the batch is planned
+    entry_ids = {operation.id for operation in batch.operations if operation.id}
+    entry_ids.update(operation.entry.id for operation in batch.operations if operation.entry and operation.entry.id)
+    state: Dict[str, Optional[dict]] = {
+        entry["id"]: entry for entry in await storage.entries.get_many(list(entry_ids), EXPORT_PROJECTION)
+    }
+    
+    results = []
+    planned = []  # (result, storage operation, document before, document after)
+    rejected = False
+    for index, operation in enumerate(batch.operations):
+        result = {"index": index, "op": operation.op, "id": operation.id}
+        results.append(result)
+        if batch.ordered and rejected:
+            result.update(status=424, detail="Nicht ausgeführt, eine vorherige Operation ist fehlgeschlagen")
+            continue
+        try:
+            storage_operation, document = await plan_batch_operation(operation, state, now)
+        except HTTPException as e:
+            result.update(status=e.status_code, detail=e.detail)
+            rejected = True
+            continue
+        entry_id = document["id"] if document else operation.id
+        result.update(id=entry_id, status=201 if operation.op == "create" else 200)
+        planned.append((result, storage_operation, state.get(entry_id), document))
+        state[entry_id] = document
+    
+    errors, unmatched = await storage.entries.bulk_write([item[1] for item in planned], ordered=batch.ordered)
+    first_error = min(errors) if errors else None
+    # Entries changed or deleted by someone else between the read above and the write
+    unmatched_ids = {planned[position][1]["id"] for position in unmatched}
+    remaining = {entry["id"] for entry in await storage.entries.get_many(list(unmatched_ids), {"id": 1})} if unmatched_ids else set()
+    
+    # Catalog, statistics and search index follow the writes that went through
+    delta = Counter()
+    attachments_by_entry = {}
+    for position, (result, storage_operation, before, after) in enumerate(planned):
+        if position in errors:
+            result.update(status=409 if "duplicate" in errors[position].lower() else 500, detail=errors[position])
+            continue
+        if batch.ordered and first_error is not None and position > first_error:
+            result.update(status=424, detail="Nicht ausgeführt, eine vorherige Operation ist fehlgeschlagen")
+            continue
+        if position in unmatched:
+            if storage_operation["id"] in remaining:
+                result.update(status=412, detail="Eintrag wurde zwischenzeitlich geändert")
+            else:
+                result.update(status=404, detail="Eintrag nicht gefunden")
+            continue
+        delta.update(counter_delta(before, after))
+        if result["op"] != "move":
+            attachments_by_entry[result["id"]] = after["attachments"] if after else []
+        if after:
+            result["rev"] = after["rev"]
+            index_entry(after)
+        else:
+            unindex_entry(result["id"])
+    
+    succeeded = sum(1 for result in results if "detail" not in result)
+    if succeeded:
+        await release_blobs(await storage.files.set_for_entries(attachments_by_entry))
+        await storage.stats.apply({name: value for name, value in delta.items() if value})
+        await storage.bump_content_version()
+    
+    return {"ordered": batch.ordered, "succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+async def ndjson_lines(request: Request):
+    """Lines of a streamed request body, holding at most one line in memory"""
+    pending = bytearray()
+    async for chunk in request.stream():
+        pending.extend(chunk)
+        start = 0
+        end = pending.find(b"\n", start)
+        while end >= 0:
+            yield bytes(pending[start:end])
+            start = end + 1
+            end = pending.find(b"\n", start)
+        del pending[:start]
+        if len(pending) > IMPORT_MAX_LINE_SIZE:
+            raise HTTPException(status_code=413, detail="Zeile im Import zu lang")
+    if pending.strip():
+        yield bytes(pending)
+
+async def import_document(line: bytes, now: datetime) -> dict:
+    """Validated entry document from one NDJSON line, payloads moved to the blob store;
+    ``updated_at`` is set by import_batch"""
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError("Zeile ist kein JSON-Objekt")
+    entry = KnowledgeEntry(**data)
+    entry.id = entry.id or str(uuid.uuid4())
+    entry.created_at = entry.created_at or now
+    for attachment in entry.attachments:
+        # Inline payloads of blobs that already exist need not be stored again
+        has_renditions = attachment.file_type != "images" or attachment.thumbnails
+        if attachment.file_data and attachment.sha256 and has_renditions and await blob_store.exists(attachment.sha256):
+            attachment.file_data = None
+    await store_attachments(entry.attachments)
+    return entry_document(entry)
+
+async def import_batch(batch: Dict[str, dict]) -> int:
+    """Upsert a batch of documents by id with catalog, statistics and search index; returns the number created"""
+    existing = {entry["id"]: entry for entry in await storage.entries.get_many(list(batch), dict(STATS_PROJECTION, rev=1))}
+    # Stamped when written, not when the import started: other workers poll for changes
+    # since their last watermark, which a long import would otherwise fall behind
+    updated_at = datetime.utcnow()
+    for entry_id, document in batch.items():
+        # Imported entries continue the revision of the entry they replace
+        document["rev"] = (existing.get(entry_id, {}).get("rev") or 0) + 1
+        document["updated_at"] = updated_at
+    created = await storage.entries.upsert_many(list(batch.values()))
+    attachments_by_entry = {entry_id: document["attachments"] for entry_id, document in batch.items()}
+    await release_blobs(await storage.files.set_for_entries(attachments_by_entry))
+    delta = Counter()
+    for entry_id, document in batch.items():
+        delta.update(counter_delta(existing.get(entry_id), document))
+    await storage.stats.apply({name: value for name, value in delta.items() if value})
+    for document in batch.values():
+        index_entry(document)
+    return created
+
+@app.get("/api/export")
+async def export_knowledge(attachments: str = "reference", current_user: str = Depends(verify_token)):
+    """Gesamte Wissensdatenbank als NDJSON streamen (eine Zeile pro Eintrag) - nur für Admins"""
+    if attachments not in ("reference", "inline"):
+        raise HTTPException(status_code=400, detail="attachments muss 'reference' oder 'inline' sein")
+    
+    async def lines():
+        async for entry in storage.entries.iter_entries(EXPORT_PROJECTION):
+            if attachments == "inline":
+                for attachment in entry.get("attachments") or []:
+                    if not attachment.get("sha256"):
+                        continue
+                    try:
+                        attachment["file_data"] = base64.b64encode(await blob_store.get(attachment["sha256"])).decode("ascii")
+                    except BlobNotFound:
+                        print(f"Export: Datei {attachment['sha256']} fehlt im Blob-Store")
+            yield encode_json(entry) + b"\n"
+    
+    filename = f"wissensdatenbank-{datetime.utcnow():%Y%m%d}.ndjson"
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/api/import")
+async def import_knowledge(request: Request, current_user: str = Depends(verify_token)):
+    """Wissenseinträge aus NDJSON importieren (Upsert nach id, gebündelt) - nur für Admins"""
+    now = datetime.utcnow()
+    batch: Dict[str, dict] = {}
+    imported = created = failed = 0
+    errors = []
+    
+    try:
+        line_number = 0
+        async for line in ndjson_lines(request):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                document = await import_document(line, now)
+            except (ValueError, HTTPException) as e:
+                failed += 1
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append({"line": line_number, "detail": e.detail if isinstance(e, HTTPException) else str(e)})
+                continue
+            
+            batch[document["id"]] = document
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                created += await import_batch(batch)
+                imported += len(batch)
+                batch = {}
+        if batch:
+            created += await import_batch(batch)
+            imported += len(batch)
+    finally:
+        # Batches written before an error stay, so caches must see them
+        if imported:
+            await storage.bump_content_version()
+    
+    return {"imported": imported, "created": created, "updated": imported - created, "failed": failed, "errors": errors}
+
+@app.on_event("startup")
+async def create_database_indexes():
+    """Benötigte Datenbank-Indizes anlegen (idempotent)"""
+    await storage.ensure_indexes()
+
+@app.on_event("startup")
+async def migrate_inline_attachments():
+    """Bestehende Base64-Anhänge in den Blob-Store verschieben"""
+    migrated = 0
+    async for entry in storage.entries.iter_inline_attachments():
+        attachments = []
+        for attachment in entry.get("attachments", []):
+            file_data = attachment.pop("file_data", None)
+            if file_data:
+                attachment["sha256"] = await blob_store.put(base64.b64decode(file_data), attachment.get("content_type"))
+            attachments.append(attachment)
+        await storage.entries.set_attachments(entry["id"], attachments)
+        await storage.files.set_for_entry(entry["id"], attachments)
+        migrated += 1
+    
+    if migrated:
+        await storage.bump_content_version()
+        print(f"{migrated} Einträge mit Anhängen in den Blob-Store migriert")
+
+@app.on_event("startup")
+async def migrate_entry_revisions():
+    """Einträgen ohne Revision die Revision 1 geben"""
+    migrated = await storage.entries.assign_initial_revs()
+    if migrated:
+        await storage.bump_content_version()
+        print(f"{migrated} Einträge mit Revision versehen")
+
+@app.on_event("startup")
+async def sync_attachment_catalog():
+    """Anhang-Katalog aus den Einträgen neu aufbauen, falls er abweicht"""
+    # Rows without blob keys would not count as references before blobs are released
+    consistent = await storage.files.count() == await storage.entries.count_attachments()
+    if consistent and await storage.files.count_without_blobs() == 0:
+        return
+    
+    # Other workers keep writing to and releasing blobs against the current catalog meanwhile
+    started = datetime.utcnow()
+    await storage.files.rebuild(storage.entries.iter_entries({"id": 1, "attachments": 1}))
+    # Entries saved during the rebuild were catalogued in the replaced collection
+    changed = storage.entries.iter_entries({"id": 1, "attachments": 1}, started - SearchIndexReconciler.CLOCK_SKEW)
+    attachments_by_entry = {entry["id"]: entry.get("attachments") or [] async for entry in changed}
+    # Blobs dropped here were released by the worker that saved the entry, if at all
+    await storage.files.set_for_entries(attachments_by_entry)
+    print(f"Anhang-Katalog mit {await storage.files.count()} Dateien aufgebaut")
+
 # Initialize with sample data
 @app.on_event("startup")
 async def initialize_sample_data():
     """Beispieldaten hinzufügen falls Datenbank leer ist"""
-    if knowledge_base.count_documents({}) == 0:
+    if await storage.entries.count() == 0:
         sample_entries = [
             {
                 "id": str(uuid.uuid4()),
@@ -471,10 +1486,11 @@ async def initialize_sample_data():
             }
         ]
         
-        knowledge_base.insert_many(sample_entries)
+        await storage.entries.insert_many([dict(entry, rev=1) for entry in sample_entries])
+        await storage.bump_content_version()
         print("Beispieldaten zur Wissensdatenbank hinzugefügt")
     
-    if categories_collection.count_documents({}) == 0:
+    if await storage.categories.count() == 0:
         default_categories = [
             {
                 "id": str(uuid.uuid4()),
@@ -494,9 +1510,32 @@ async def initialize_sample_data():
             }
         ]
         
-        categories_collection.insert_many(default_categories)
+        await storage.categories.insert_many(default_categories)
+        await storage.bump_content_version()
         print("Standard-Kategorien hinzugefügt")
 
+@app.on_event("startup")
+async def start_stats_reconciler():
+    """Statistiken neu berechnen und regelmäßig abgleichen"""
+    await reconcile_stats(storage)
+    if STATS_RECONCILE_INTERVAL > 0:
+        asyncio.create_task(run_stats_reconciler(storage, STATS_RECONCILE_INTERVAL))
+
+@app.on_event("startup")
+async def start_search_index():
+    """Suchindex aufbauen und mit anderen Workern abgleichen"""
+    for category in await storage.categories.list_all():
+        suggest_index.add_category(category["name"])
+    await search_reconciler.rebuild()
+    print(f"Suchindex mit {len(search_index)} Einträgen aufgebaut")
+    if SEARCH_RECONCILE_INTERVAL > 0:
+        asyncio.create_task(search_reconciler.run())
+
+@app.on_event("shutdown")
+async def stop_thumbnail_workers():
+    """Worker-Prozesse für Vorschaubilder beenden"""
+    thumbnail_renderer.shutdown()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""Materialized statistics.
+
+Write paths apply counter deltas, so reading the statistics never touches
+the entries. Counters are flat names:
+
+- ``entries``, ``attachments``, ``attachment_bytes``
+- ``category:<name>`` entries per category
+- ``type:<file_type>:count`` / ``type:<file_type>:bytes`` attachments per type
+
+A periodic reconciliation recomputes them with one aggregation to correct
+any drift (e.g. writes that bypassed the API). It runs in one worker at a
+time, under a lease, since overlapping runs would each apply the same
+correction.
+"""
+import asyncio
+import uuid
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, Optional
+
+# Fields needed to compute the counters of an entry
+STATS_PROJECTION = {"_id": 0, "id": 1, "category": 1, "attachments.file_type": 1, "attachments.file_size": 1}
+
+RECONCILE_LEASE = "stats_reconcile"
+# Far longer than one aggregation takes; frees the lease of a worker that died mid-run
+RECONCILE_LEASE_DURATION = timedelta(minutes=10)
+# Identifies this process as lease holder
+LEASE_OWNER = uuid.uuid4().hex
+
+
+def entry_counters(entry: Optional[dict]) -> Counter:
+    """Counter contributions of one entry (empty for None)"""
+    counters = Counter()
+    if not entry:
+        return counters
+    counters["entries"] += 1
+    if entry.get("category"):
+        counters[f"category:{entry['category']}"] += 1
+    for attachment in entry.get("attachments") or []:
+        file_type = attachment.get("file_type") or "other"
+        size = attachment.get("file_size") or 0
+        counters["attachments"] += 1
+        counters["attachment_bytes"] += size
+        counters[f"type:{file_type}:count"] += 1
+        counters[f"type:{file_type}:bytes"] += size
+    return counters
+
+
+def counter_delta(old: Optional[dict], new: Optional[dict]) -> Dict[str, int]:
+    """Non-zero counter changes from replacing ``old`` by ``new``"""
+    delta = Counter(entry_counters(new))
+    delta.subtract(entry_counters(old))
+    return {name: value for name, value in delta.items() if value}
+
+
+def counters_from_totals(totals: dict) -> Dict[str, int]:
+    """Counters from the aggregated totals of KnowledgeRepository.stats_totals()"""
+    counters = Counter()
+    for category, count in totals["categories"].items():
+        counters["entries"] += count
+        if category:
+            counters[f"category:{category}"] += count
+    for file_type, values in totals["attachment_types"].items():
+        file_type = file_type or "other"
+        counters["attachments"] += values["count"]
+        counters["attachment_bytes"] += values["bytes"]
+        counters[f"type:{file_type}:count"] += values["count"]
+        counters[f"type:{file_type}:bytes"] += values["bytes"]
+    return dict(counters)
+
+
+def stats_view(counters: Dict[str, int]) -> dict:
+    """API representation of the counters"""
+    categories = {}
+    attachment_types = {}
+    for name, value in counters.items():
+        if name.startswith("category:") and value > 0:
+            categories[name[len("category:"):]] = value
+        elif name.startswith("type:") and value > 0:
+            file_type, _, measure = name[len("type:"):].rpartition(":")
+            attachment_types.setdefault(file_type, {"count": 0, "bytes": 0})[measure] = value
+    return {
+        "total_entries": counters.get("entries", 0),
+        "categories_count": len(categories),
+        "total_attachments": counters.get("attachments", 0),
+        "attachment_bytes": counters.get("attachment_bytes", 0),
+        "categories": dict(sorted(categories.items())),
+        "attachment_types": dict(sorted(attachment_types.items())),
+    }
+
+
+async def reconcile_stats(storage) -> Optional[Dict[str, int]]:
+    """Recompute all counters from the entries and correct the stored ones.
+
+    Corrections are applied as increments, so deltas of concurrent writes
+    are never overwritten. If counters changed while the entries were
+    scanned, the totals may already be outdated and nothing is corrected
+    until the next run. Returns the recomputed counters, or None if another
+    worker is reconciling.
+    """
+    if not await storage.acquire_lease(RECONCILE_LEASE, LEASE_OWNER, RECONCILE_LEASE_DURATION):
+        return None
+    try:
+        return await _reconcile(storage)
+    finally:
+        await storage.release_lease(RECONCILE_LEASE, LEASE_OWNER)
+
+
+async def _reconcile(storage) -> Dict[str, int]:
+    stored = await storage.stats.get_all()
+    counters = counters_from_totals(await storage.entries.stats_totals())
+    if await storage.stats.get_all() != stored:
+        return counters
+
+    correction = Counter(counters)
+    correction.subtract(stored)
+    correction = {name: value for name, value in correction.items() if value}
+    if correction:
+        await storage.stats.apply(correction)
+        await storage.stats.delete_zero()
+        # Cached /api/stats responses were built from the drifted counters
+        await storage.bump_content_version()
+    return counters
+
+
+async def run_stats_reconciler(storage, interval: float):
+    """Reconcile the counters every ``interval`` seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reconcile_stats(storage)
+        except Exception as e:
+            print(f"Statistik-Abgleich fehlgeschlagen: {e}")
@@ -0,0 +1,27 @@
+"""Storage backends behind a repository interface.
+
+STORAGE_BACKEND selects ``mongo`` (default) or ``memory``. The in-memory
+backend needs no services and is meant for local test runs and benchmarks.
+"""
+import os
+
+from storage.base import (
+    AttachmentRepository, CategoryRepository, KnowledgeRepository, StatsRepository, Storage, attachment_blobs
+)
+
+
+def create_storage() -> Storage:
+    backend = os.environ.get("STORAGE_BACKEND", "mongo").lower()
+    if backend == "mongo":
+        from storage.mongo import MongoStorage
+        return MongoStorage()
+    if backend == "memory":
+        from storage.memory import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+__all__ = [
+    "AttachmentRepository", "CategoryRepository", "KnowledgeRepository", "StatsRepository", "Storage",
+    "attachment_blobs", "create_storage",
+]
@@ -0,0 +1,262 @@
+"""Repository interfaces shared by all storage backends.
+
+Projections use the MongoDB notation (``{"field": 1}`` to include,
+``{"field": 0}`` to exclude, dotted paths into sub-documents and arrays).
+Documents are returned without ``_id``.
+"""
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+# How long held blobs (e.g. of uploads not saved with an entry yet) are never released
+BLOB_HOLD = timedelta(hours=24)
+
+
+def attachment_blobs(attachment: dict) -> List[str]:
+    """Blob keys an attachment refers to: its file and all renditions"""
+    keys = [attachment["sha256"]] if attachment.get("sha256") else []
+    for renditions in (attachment.get("thumbnails") or {}).values():
+        keys.extend(renditions.values())
+    return keys
+
+
+class KnowledgeRepository:
+    """Knowledge entries, keyed by their ``id``"""
+
+    async def insert(self, entry: dict) -> None:
+        raise NotImplementedError
+
+    async def insert_many(self, entries: List[dict]) -> None:
+        raise NotImplementedError
+
+    async def get(self, entry_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def exists(self, entry_id: str) -> bool:
+        raise NotImplementedError
+
+    async def get_many(self, entry_ids: List[str], projection: Optional[dict] = None) -> List[dict]:
+        """Entries with the given ids, in no particular order"""
+        raise NotImplementedError
+
+    async def replace(self, entry_id: str, entry: dict, rev: Optional[int] = None) -> bool:
+        """Replace an entry; with ``rev`` only if that is its stored revision"""
+        raise NotImplementedError
+
+    async def upsert_many(self, entries: List[dict]) -> int:
+        """Insert or replace entries by ``id`` (unique within the batch); returns the number inserted"""
+        raise NotImplementedError
+
+    async def update(
+        self, entry_id: str, update: dict, projection: Optional[dict] = None, rev: Optional[int] = None
+    ) -> Optional[dict]:
+        """Apply an update (``$set``, ``$unset``, ``$inc``, ``$push`` with ``$each``,
+        ``$pull`` with a field condition) to top-level fields; returns the
+        updated entry, or None if it does not exist or ``rev`` does not match"""
+        raise NotImplementedError
+
+    async def delete(self, entry_id: str, rev: Optional[int] = None) -> bool:
+        """Delete an entry; with ``rev`` only if that is its stored revision"""
+        raise NotImplementedError
+
+    async def assign_initial_revs(self) -> int:
+        """Give entries without a ``rev`` revision 1; returns the number changed"""
+        raise NotImplementedError
+
+    async def bulk_write(self, operations: List[dict], ordered: bool = True) -> Tuple[Dict[int, str], Set[int]]:
+        """Run write operations in one round trip; returns error messages by
+        operation index and the indexes of operations that matched no entry.
+
+        Operations are ``{"type": "insert", "entry": {...}}``,
+        ``{"type": "replace", "id": ..., "entry": {...}}``,
+        ``{"type": "update", "id": ..., "update": {...}}`` (see ``update``) and
+        ``{"type": "delete", "id": ...}``; replace, update and delete may carry
+        a ``condition`` of field values the entry must have, e.g. its ``rev``. Ordered writes stop at the first
+        error, unordered ones carry on with the rest. Operations that match
+        nothing are no errors and never stop the batch.
+        """
+        raise NotImplementedError
+
+    async def list_page(
+        self,
+        category: Optional[str],
+        after: Optional[Tuple[datetime, str]],
+        limit: int,
+        projection: Optional[dict] = None,
+    ) -> List[dict]:
+        """Newest entries first, ordered by (created_at, id), after the given key"""
+        raise NotImplementedError
+
+    async def find_by_category(self, category: str, projection: Optional[dict] = None) -> List[dict]:
+        raise NotImplementedError
+
+    async def recategorize(self, category: str, new_category: str, updated_at: datetime) -> int:
+        """Move all entries of a category, increasing their ``rev``; returns the number of moved entries"""
+        raise NotImplementedError
+
+    def iter_entries(self, projection: Optional[dict] = None, changed_since: Optional[datetime] = None) -> AsyncIterator[dict]:
+        """All entries, or those with ``updated_at >= changed_since``"""
+        raise NotImplementedError
+
+    def iter_inline_attachments(self) -> AsyncIterator[dict]:
+        """Entries still carrying Base64 payloads in ``attachments.file_data``"""
+        raise NotImplementedError
+
+    async def set_attachments(self, entry_id: str, attachments: List[dict]) -> None:
+        """Replace the attachment list of an entry, increasing its ``rev``"""
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def entry_ids(self) -> List[str]:
+        raise NotImplementedError
+
+    async def categories(self) -> List[str]:
+        """Distinct categories used by entries"""
+        raise NotImplementedError
+
+    async def count_attachments(self) -> int:
+        raise NotImplementedError
+
+    async def stats_totals(self) -> dict:
+        """Aggregated totals in one pass.
+
+        ``{"categories": {name: entries}, "attachment_types": {type: {"count": n, "bytes": n}}}``
+        """
+        raise NotImplementedError
+
+    def watch(self, projection: dict):
+        """Async context manager yielding Mongo-style change events.
+
+        Raises NotImplementedError where the backend has no change feed.
+        """
+        raise NotImplementedError
+
+
+class CategoryRepository:
+    """Custom categories, keyed by ``id`` with unique ``name``"""
+
+    async def insert(self, category: dict) -> None:
+        raise NotImplementedError
+
+    async def insert_many(self, categories: List[dict]) -> None:
+        raise NotImplementedError
+
+    async def get(self, category_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def get_by_name(self, name: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def list_all(self) -> List[dict]:
+        raise NotImplementedError
+
+    async def delete(self, category_id: str) -> bool:
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+
+class AttachmentRepository:
+    """Catalog of attachments by ``(entry_id, id)``.
+
+    Mirrors the attachment metadata stored in entries so downloads are a
+    single lookup that never reads the parent entry. The same file id may
+    be catalogued for several entries (e.g. after an import or a copied
+    entry); each row also lists its ``blobs`` (see ``attachment_blobs``),
+    so blobs are only released once no row refers to them any more and
+    they are not held (see ``hold_blobs``).
+    """
+
+    async def get(self, file_id: str) -> Optional[dict]:
+        """A catalogued attachment with this file id, of any entry"""
+        raise NotImplementedError
+
+    async def set_for_entry(self, entry_id: str, attachments: List[dict]) -> Set[str]:
+        """Make ``attachments`` the catalogued attachments of an entry; returns
+        the blob keys that no catalogued attachment refers to any more"""
+        raise NotImplementedError
+
+    async def set_for_entries(self, attachments_by_entry: Dict[str, List[dict]]) -> Set[str]:
+        """``set_for_entry`` for many entries in one round trip"""
+        raise NotImplementedError
+
+    async def delete_for_entry(self, entry_id: str) -> Set[str]:
+        """Drop the attachments of an entry; returns the released blob keys like ``set_for_entry``"""
+        raise NotImplementedError
+
+    async def hold_blobs(self, keys: Iterable[str]) -> None:
+        """Keep blobs from being released for ``BLOB_HOLD``, e.g. those of an
+        upload that is referenced by no entry yet; ``set_for_entries`` lifts
+        the hold once a catalogued attachment refers to them"""
+        raise NotImplementedError
+
+    async def rebuild(self, entries: AsyncIterator[dict]) -> None:
+        """Replace the catalog by the attachments of ``entries`` (with ``id`` and
+        ``attachments``); the current catalog stays in use until the new one is complete"""
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def count_without_blobs(self) -> int:
+        """Rows catalogued before blob keys were recorded"""
+        raise NotImplementedError
+
+
+class StatsRepository:
+    """Named integer counters, see stats.py"""
+
+    async def apply(self, delta: Dict[str, int]) -> None:
+        """Add the given amounts to the counters"""
+        raise NotImplementedError
+
+    async def get_all(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    async def delete_zero(self) -> None:
+        """Drop counters that went down to 0"""
+        raise NotImplementedError
+
+
+class Storage:
+    """Repositories of one backend plus backend-level maintenance"""
+
+    entries: KnowledgeRepository
+    categories: CategoryRepository
+    files: AttachmentRepository
+    stats: StatsRepository
+    # Mongo database handle for GridFS, None for backends without one
+    db = None
+
+    async def category_overview(self) -> List[dict]:
+        """Registered and used categories ordered by name.
+
+        Each item has ``name``, ``entry_count`` (from the ``category:<name>``
+        counters of the stats repository) and, for registered categories,
+        ``id``, ``icon``, ``color`` and ``description``.
+        """
+        raise NotImplementedError
+
+    async def content_version(self) -> int:
+        """Counter bumped by every write that changes public read responses"""
+        raise NotImplementedError
+
+    async def bump_content_version(self) -> int:
+        raise NotImplementedError
+
+    async def acquire_lease(self, name: str, owner: str, duration: timedelta) -> bool:
+        """Take (or renew) the named lease for ``duration`` unless another owner
+        holds it and it has not expired; returns whether ``owner`` holds it now"""
+        raise NotImplementedError
+
+    async def release_lease(self, name: str, owner: str) -> None:
+        """Give up the named lease if ``owner`` still holds it"""
+        raise NotImplementedError
+
+    async def ensure_indexes(self) -> dict:
+        return {}
+
+    async def index_usage(self) -> dict:
+        return {}
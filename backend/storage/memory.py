@@ -0,0 +1,447 @@
+"""In-memory repositories: dicts plus sorted keys, no external services.
+
+Documents are copied on the way in and out so callers can never mutate
+stored state, mirroring the isolation a database gives.
+"""
+import bisect
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from storage.base import (
+    BLOB_HOLD, AttachmentRepository, CategoryRepository, KnowledgeRepository, StatsRepository, Storage,
+    attachment_blobs
+)
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+def _include(source: dict, path: List[str], target: dict):
+    key = path[0]
+    if key not in source:
+        return
+    value = source[key]
+    if len(path) == 1:
+        target[key] = _copy(value)
+    elif isinstance(value, dict):
+        _include(value, path[1:], target.setdefault(key, {}))
+    elif isinstance(value, list):
+        documents = [item for item in value if isinstance(item, dict)]
+        projected = target.setdefault(key, [{} for _ in documents])
+        for item, target_item in zip(documents, projected):
+            _include(item, path[1:], target_item)
+
+
+def _exclude(target: dict, path: List[str]):
+    key = path[0]
+    if key not in target:
+        return
+    if len(path) == 1:
+        del target[key]
+    elif isinstance(target[key], dict):
+        _exclude(target[key], path[1:])
+    elif isinstance(target[key], list):
+        for item in target[key]:
+            if isinstance(item, dict):
+                _exclude(item, path[1:])
+
+
+def project(document: dict, projection: Optional[dict] = None) -> dict:
+    """Copy of a document restricted by a Mongo-style projection"""
+    fields = {path: value for path, value in (projection or {}).items() if path != "_id"}
+    if any(fields.values()):
+        result = {}
+        for path, value in fields.items():
+            if value:
+                _include(document, path.split("."), result)
+        return result
+
+    result = _copy(document)
+    for path in fields:
+        _exclude(result, path.split("."))
+    return result
+
+
+def _collation_key(text: str) -> Tuple[str, str]:
+    """Case- and accent-insensitive order, close to a German collation"""
+    base = "".join(char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char))
+    return base.casefold(), text
+
+
+def _matches(item, condition: dict) -> bool:
+    """Whether a document matches a condition like {"id": {"$in": [...]}} (e.g. of $pull)"""
+    if not isinstance(item, dict):
+        return False
+    for field, expected in condition.items():
+        if isinstance(expected, dict) and "$in" in expected:
+            if item.get(field) not in expected["$in"]:
+                return False
+        elif item.get(field) != expected:
+            return False
+    return True
+
+
+def _sort_key(entry: dict) -> Tuple[datetime, str]:
+    return entry.get("created_at") or datetime.min, entry["id"]
+
+
+class MemoryKnowledgeRepository(KnowledgeRepository):
+    def __init__(self):
+        self._entries: Dict[str, dict] = {}
+        # Ascending (created_at, id) keys, overall and per category
+        self._order: List[Tuple[datetime, str]] = []
+        self._category_order: Dict[str, List[Tuple[datetime, str]]] = {}
+
+    def _link(self, entry: dict):
+        key = _sort_key(entry)
+        bisect.insort(self._order, key)
+        bisect.insort(self._category_order.setdefault(entry.get("category"), []), key)
+
+    def _unlink(self, entry: dict):
+        key = _sort_key(entry)
+        del self._order[bisect.bisect_left(self._order, key)]
+        keys = self._category_order[entry.get("category")]
+        del keys[bisect.bisect_left(keys, key)]
+        if not keys:
+            del self._category_order[entry.get("category")]
+
+    def _store(self, entry: dict):
+        entry = _copy(entry)
+        entry.pop("_id", None)
+        previous = self._entries.get(entry["id"])
+        if previous is not None:
+            self._unlink(previous)
+        try:
+            self._link(entry)
+        except TypeError:
+            # Keys that do not compare (e.g. naive and aware datetimes) leave the entry as it was
+            if previous is not None:
+                self._link(previous)
+            raise
+        self._entries[entry["id"]] = entry
+
+    async def insert(self, entry: dict) -> None:
+        if entry["id"] in self._entries:
+            raise ValueError(f"Duplicate entry id: {entry['id']}")
+        self._store(entry)
+
+    async def insert_many(self, entries: List[dict]) -> None:
+        for entry in entries:
+            await self.insert(entry)
+
+    async def get(self, entry_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        entry = self._entries.get(entry_id)
+        return project(entry, projection) if entry is not None else None
+
+    async def exists(self, entry_id: str) -> bool:
+        return entry_id in self._entries
+
+    async def get_many(self, entry_ids: List[str], projection: Optional[dict] = None) -> List[dict]:
+        return [project(self._entries[entry_id], projection) for entry_id in entry_ids if entry_id in self._entries]
+
+    def _matches_rev(self, entry_id: str, rev: Optional[int]) -> bool:
+        return entry_id in self._entries and (rev is None or self._entries[entry_id].get("rev") == rev)
+
+    async def replace(self, entry_id: str, entry: dict, rev: Optional[int] = None) -> bool:
+        if not self._matches_rev(entry_id, rev):
+            return False
+        self._store(dict(entry, id=entry_id))
+        return True
+
+    async def upsert_many(self, entries: List[dict]) -> int:
+        inserted = sum(1 for entry in entries if entry["id"] not in self._entries)
+        for entry in entries:
+            self._store(entry)
+        return inserted
+
+    async def delete(self, entry_id: str, rev: Optional[int] = None) -> bool:
+        if not self._matches_rev(entry_id, rev):
+            return False
+        self._unlink(self._entries.pop(entry_id))
+        return True
+
+    async def assign_initial_revs(self) -> int:
+        missing = [entry_id for entry_id, entry in self._entries.items() if "rev" not in entry]
+        for entry_id in missing:
+            self._entries[entry_id]["rev"] = 1
+        return len(missing)
+
+    def _update(self, entry_id: str, update: dict):
+        entry = _copy(self._entries[entry_id])
+        for field, value in update.get("$set", {}).items():
+            entry[field] = _copy(value)
+        for field in update.get("$unset", {}):
+            entry.pop(field, None)
+        for field, value in update.get("$inc", {}).items():
+            entry[field] = entry.get(field, 0) + value
+        for field, value in update.get("$push", {}).items():
+            values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+            entry.setdefault(field, []).extend(_copy(values))
+        for field, condition in update.get("$pull", {}).items():
+            entry[field] = [item for item in entry.get(field, []) if not _matches(item, condition)]
+        self._store(entry)
+
+    async def update(
+        self, entry_id: str, update: dict, projection: Optional[dict] = None, rev: Optional[int] = None
+    ) -> Optional[dict]:
+        if not self._matches_rev(entry_id, rev):
+            return None
+        self._update(entry_id, update)
+        return project(self._entries[entry_id], projection)
+
+    async def bulk_write(self, operations: List[dict], ordered: bool = True) -> Tuple[Dict[int, str], Set[int]]:
+        errors = {}
+        unmatched = set()
+        for index, operation in enumerate(operations):
+            if operation["type"] == "insert":
+                if operation["entry"]["id"] in self._entries:
+                    errors[index] = f"Duplicate entry id: {operation['entry']['id']}"
+                else:
+                    self._store(operation["entry"])
+            # Like Mongo, updates and deletes of missing entries (or other revisions) match nothing
+            elif operation["id"] not in self._entries or not _matches(self._entries[operation["id"]], operation.get("condition") or {}):
+                unmatched.add(index)
+            elif operation["type"] == "replace":
+                self._store(dict(operation["entry"], id=operation["id"]))
+            elif operation["type"] == "update":
+                self._update(operation["id"], operation["update"])
+            else:
+                await self.delete(operation["id"])
+            if errors and ordered:
+                break
+        return errors, unmatched
+
+    async def list_page(
+        self,
+        category: Optional[str],
+        after: Optional[Tuple[datetime, str]],
+        limit: int,
+        projection: Optional[dict] = None,
+    ) -> List[dict]:
+        keys = self._category_order.get(category, []) if category else self._order
+        end = bisect.bisect_left(keys, after) if after else len(keys)
+        start = max(0, end - limit)
+        return [project(self._entries[entry_id], projection) for _, entry_id in reversed(keys[start:end])]
+
+    async def find_by_category(self, category: str, projection: Optional[dict] = None) -> List[dict]:
+        return [project(self._entries[entry_id], projection) for _, entry_id in self._category_order.get(category, [])]
+
+    async def recategorize(self, category: str, new_category: str, updated_at: datetime) -> int:
+        moved = [self._entries[entry_id] for _, entry_id in self._category_order.get(category, [])]
+        for entry in moved:
+            self._store(dict(entry, category=new_category, updated_at=updated_at, rev=entry.get("rev", 0) + 1))
+        return len(moved)
+
+    async def iter_entries(self, projection: Optional[dict] = None, changed_since: Optional[datetime] = None):
+        for entry in list(self._entries.values()):
+            if changed_since is None or (entry.get("updated_at") and entry["updated_at"] >= changed_since):
+                yield project(entry, projection)
+
+    async def iter_inline_attachments(self):
+        for entry in list(self._entries.values()):
+            if any(isinstance(attachment.get("file_data"), str) for attachment in entry.get("attachments") or []):
+                yield project(entry, {"id": 1, "attachments": 1})
+
+    async def set_attachments(self, entry_id: str, attachments: List[dict]) -> None:
+        if entry_id in self._entries:
+            entry = self._entries[entry_id]
+            self._store(dict(entry, attachments=attachments, rev=entry.get("rev", 0) + 1))
+
+    async def count(self) -> int:
+        return len(self._entries)
+
+    async def entry_ids(self) -> List[str]:
+        return list(self._entries)
+
+    async def categories(self) -> List[str]:
+        return [category for category in self._category_order if category is not None]
+
+    async def count_attachments(self) -> int:
+        return sum(len(entry.get("attachments") or []) for entry in self._entries.values())
+
+    async def stats_totals(self) -> dict:
+        categories = {}
+        attachment_types = {}
+        for entry in self._entries.values():
+            categories[entry.get("category")] = categories.get(entry.get("category"), 0) + 1
+            for attachment in entry.get("attachments") or []:
+                totals = attachment_types.setdefault(attachment.get("file_type"), {"count": 0, "bytes": 0})
+                totals["count"] += 1
+                totals["bytes"] += attachment.get("file_size") or 0
+        return {"categories": categories, "attachment_types": attachment_types}
+
+
+class MemoryCategoryRepository(CategoryRepository):
+    def __init__(self):
+        self._categories: Dict[str, dict] = {}
+
+    async def insert(self, category: dict) -> None:
+        if await self.get_by_name(category["name"]):
+            raise ValueError(f"Duplicate category name: {category['name']}")
+        category = _copy(category)
+        category.pop("_id", None)
+        self._categories[category["id"]] = category
+
+    async def insert_many(self, categories: List[dict]) -> None:
+        for category in categories:
+            await self.insert(category)
+
+    async def get(self, category_id: str) -> Optional[dict]:
+        category = self._categories.get(category_id)
+        return _copy(category) if category is not None else None
+
+    async def get_by_name(self, name: str) -> Optional[dict]:
+        for category in self._categories.values():
+            if category["name"] == name:
+                return _copy(category)
+        return None
+
+    async def list_all(self) -> List[dict]:
+        return [_copy(category) for category in self._categories.values()]
+
+    async def delete(self, category_id: str) -> bool:
+        return self._categories.pop(category_id, None) is not None
+
+    async def count(self) -> int:
+        return len(self._categories)
+
+
+class MemoryAttachmentRepository(AttachmentRepository):
+    def __init__(self):
+        # file id -> entry id -> catalogued attachment
+        self._files: Dict[str, Dict[str, dict]] = {}
+        self._entry_files: Dict[str, List[str]] = {}
+        self._blob_refs: Dict[str, int] = {}
+        # Held blob key -> time it was held
+        self._holds: Dict[str, datetime] = {}
+
+    async def get(self, file_id: str) -> Optional[dict]:
+        rows = self._files.get(file_id)
+        return _copy(next(iter(rows.values()))) if rows else None
+
+    def _drop(self, entry_id: str) -> Set[str]:
+        """Remove the rows of an entry; returns the blob keys they referred to"""
+        keys = set()
+        for file_id in self._entry_files.pop(entry_id, []):
+            row = self._files[file_id].pop(entry_id)
+            if not self._files[file_id]:
+                del self._files[file_id]
+            for key in row["blobs"]:
+                self._blob_refs[key] -= 1
+                keys.add(key)
+        return keys
+
+    async def set_for_entry(self, entry_id: str, attachments: List[dict]) -> Set[str]:
+        return await self.set_for_entries({entry_id: attachments})
+
+    async def set_for_entries(self, attachments_by_entry: Dict[str, List[dict]]) -> Set[str]:
+        candidates = set()
+        for entry_id in attachments_by_entry:
+            candidates |= self._drop(entry_id)
+        for entry_id, attachments in attachments_by_entry.items():
+            for attachment in attachments:
+                if entry_id in self._files.get(attachment["id"], {}):
+                    continue
+                row = dict(_copy(attachment), entry_id=entry_id, blobs=attachment_blobs(attachment))
+                self._files.setdefault(attachment["id"], {})[entry_id] = row
+                self._entry_files.setdefault(entry_id, []).append(attachment["id"])
+                for key in row["blobs"]:
+                    self._blob_refs[key] = self._blob_refs.get(key, 0) + 1
+                    self._holds.pop(key, None)
+        unreferenced = {key for key in candidates if self._blob_refs.get(key, 0) <= 0}
+        for key in unreferenced:
+            self._blob_refs.pop(key, None)
+        cutoff = datetime.utcnow() - BLOB_HOLD
+        return {key for key in unreferenced if self._holds.get(key, cutoff) <= cutoff}
+
+    async def delete_for_entry(self, entry_id: str) -> Set[str]:
+        return await self.set_for_entries({entry_id: []})
+
+    async def hold_blobs(self, keys: Iterable[str]) -> None:
+        held_at = datetime.utcnow()
+        cutoff = held_at - BLOB_HOLD
+        self._holds = {key: time for key, time in self._holds.items() if time > cutoff}
+        for key in keys:
+            self._holds[key] = held_at
+
+    async def rebuild(self, entries: AsyncIterator[dict]) -> None:
+        fresh = MemoryAttachmentRepository()
+        async for entry in entries:
+            await fresh.set_for_entries({entry["id"]: entry.get("attachments") or []})
+        self._files, self._entry_files, self._blob_refs = fresh._files, fresh._entry_files, fresh._blob_refs
+
+    async def count(self) -> int:
+        return sum(len(self._entry_files[entry_id]) for entry_id in self._entry_files)
+
+    async def count_without_blobs(self) -> int:
+        return 0
+
+
+class MemoryStatsRepository(StatsRepository):
+    def __init__(self):
+        self._counters: Dict[str, int] = {}
+
+    async def apply(self, delta: Dict[str, int]) -> None:
+        for name, value in delta.items():
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    async def get_all(self) -> Dict[str, int]:
+        return dict(self._counters)
+
+    async def delete_zero(self) -> None:
+        self._counters = {name: value for name, value in self._counters.items() if value}
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.entries = MemoryKnowledgeRepository()
+        self.categories = MemoryCategoryRepository()
+        self.files = MemoryAttachmentRepository()
+        self.stats = MemoryStatsRepository()
+        # Starts from the clock so validators from an earlier run never match
+        self._content_version = int(time.time() * 1000)
+        # Lease name -> (owner, expiry)
+        self._leases: Dict[str, Tuple[str, datetime]] = {}
+
+    async def category_overview(self) -> List[dict]:
+        overview = {}
+        for category in await self.categories.list_all():
+            overview[category["name"]] = {
+                "name": category["name"],
+                "id": category.get("id"),
+                "icon": category.get("icon"),
+                "color": category.get("color"),
+                "description": category.get("description"),
+                "entry_count": 0,
+            }
+        for name, value in (await self.stats.get_all()).items():
+            if name.startswith("category:") and value > 0:
+                category = overview.setdefault(name[len("category:"):], {"name": name[len("category:"):], "entry_count": 0})
+                category["entry_count"] += value
+        return sorted(overview.values(), key=lambda category: _collation_key(category["name"]))
+
+    async def content_version(self) -> int:
+        return self._content_version
+
+    async def bump_content_version(self) -> int:
+        self._content_version += 1
+        return self._content_version
+
+    async def acquire_lease(self, name: str, owner: str, duration: timedelta) -> bool:
+        now = datetime.utcnow()
+        holder, expires_at = self._leases.get(name, (owner, now))
+        if holder != owner and expires_at > now:
+            return False
+        self._leases[name] = (owner, now + duration)
+        return True
+
+    async def release_lease(self, name: str, owner: str) -> None:
+        if self._leases.get(name, (None,))[0] == owner:
+            del self._leases[name]
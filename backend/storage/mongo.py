@@ -0,0 +1,448 @@
+"""MongoDB repositories on top of the async Motor client."""
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from database import db as mongo_db
+from indexes import INDEXES, ensure_indexes, index_usage
+from storage.base import (
+    BLOB_HOLD, AttachmentRepository, CategoryRepository, KnowledgeRepository, StatsRepository, Storage,
+    attachment_blobs
+)
+
+
+def _entry_filter(entry_id: str, rev: Optional[int]) -> dict:
+    return {"id": entry_id} if rev is None else {"id": entry_id, "rev": rev}
+
+
+def _as_stored(value):
+    """Value as read back from MongoDB, which keeps datetimes to the millisecond"""
+    if isinstance(value, datetime):
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+def _shows_write(entry: dict, operation: dict) -> bool:
+    """Whether an entry carries the revision and change time set by a replace or update"""
+    if operation["type"] == "replace":
+        written = operation["entry"]
+    else:
+        written = dict(operation["update"].get("$set", {}))
+        increment = operation["update"].get("$inc", {}).get("rev")
+        expected = (operation.get("condition") or {}).get("rev")
+        if increment is not None and expected is not None:
+            written["rev"] = expected + increment
+    return all(_as_stored(written[field]) == entry.get(field) for field in ("rev", "updated_at") if field in written)
+
+
+def _without_id(projection: Optional[dict]) -> dict:
+    projection = dict(projection or {})
+    projection["_id"] = 0
+    return projection
+
+
+class MongoKnowledgeRepository(KnowledgeRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, entry: dict) -> None:
+        # insert_one adds _id to the passed document
+        await self.collection.insert_one(dict(entry))
+
+    async def insert_many(self, entries: List[dict]) -> None:
+        await self.collection.insert_many([dict(entry) for entry in entries])
+
+    async def get(self, entry_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"id": entry_id}, _without_id(projection))
+
+    async def exists(self, entry_id: str) -> bool:
+        return await self.collection.find_one({"id": entry_id}, {"_id": 1}) is not None
+
+    async def get_many(self, entry_ids: List[str], projection: Optional[dict] = None) -> List[dict]:
+        results = self.collection.find({"id": {"$in": entry_ids}}, _without_id(projection))
+        return await results.to_list(length=None)
+
+    async def replace(self, entry_id: str, entry: dict, rev: Optional[int] = None) -> bool:
+        result = await self.collection.replace_one(_entry_filter(entry_id, rev), entry)
+        return result.matched_count > 0
+
+    async def upsert_many(self, entries: List[dict]) -> int:
+        if not entries:
+            return 0
+        result = await self.collection.bulk_write([
+            ReplaceOne({"id": entry["id"]}, dict(entry), upsert=True)
+            for entry in entries
+        ], ordered=False)
+        return result.upserted_count
+
+    async def update(
+        self, entry_id: str, update: dict, projection: Optional[dict] = None, rev: Optional[int] = None
+    ) -> Optional[dict]:
+        return await self.collection.find_one_and_update(
+            _entry_filter(entry_id, rev),
+            update,
+            projection=_without_id(projection),
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def delete(self, entry_id: str, rev: Optional[int] = None) -> bool:
+        result = await self.collection.delete_one(_entry_filter(entry_id, rev))
+        return result.deleted_count > 0
+
+    async def assign_initial_revs(self) -> int:
+        result = await self.collection.update_many({"rev": {"$exists": False}}, {"$set": {"rev": 1}})
+        return result.modified_count
+
+    async def bulk_write(self, operations: List[dict], ordered: bool = True) -> Tuple[Dict[int, str], Set[int]]:
+        requests = []
+        for operation in operations:
+            if operation["type"] == "insert":
+                requests.append(InsertOne(dict(operation["entry"])))
+                continue
+            entry_filter = dict(operation.get("condition") or {}, id=operation["id"])
+            if operation["type"] == "replace":
+                requests.append(ReplaceOne(entry_filter, dict(operation["entry"])))
+            elif operation["type"] == "update":
+                requests.append(UpdateOne(entry_filter, operation["update"]))
+            else:
+                requests.append(DeleteOne(entry_filter))
+        if not requests:
+            return {}, set()
+        try:
+            result = (await self.collection.bulk_write(requests, ordered=ordered)).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+        errors = {error["index"]: error["errmsg"] for error in result.get("writeErrors", [])}
+
+        # Bulk results only count matches, so misses are looked up only if there are any
+        last = min(errors) if errors and ordered else len(operations) - 1
+        attempted = [(index, operation) for index, operation in enumerate(operations[:last + 1]) if index not in errors]
+        changes = [(index, operation) for index, operation in attempted if operation["type"] in ("replace", "update")]
+        deletes = [(index, operation) for index, operation in attempted if operation["type"] == "delete"]
+        if result.get("nMatched", 0) >= len(changes) and result.get("nRemoved", 0) >= len(deletes):
+            return errors, set()
+        return errors, await self._unmatched(changes, deletes, result.get("nRemoved", 0))
+
+    async def _unmatched(self, changes: List[Tuple[int, dict]], deletes: List[Tuple[int, dict]], removed: int) -> Set[int]:
+        """Indexes of bulk operations that matched nothing, told apart by the entries as they are now"""
+        entry_ids = list({operation["id"] for _, operation in changes + deletes})
+        current = {entry["id"]: entry for entry in await self.get_many(entry_ids)}
+        unmatched = set()
+        for index, operation in changes:
+            entry = current.get(operation["id"])
+            if entry is None or not _shows_write(entry, operation):
+                unmatched.add(index)
+        # An entry deleted by someone else cannot be told from one deleted here;
+        # if that happened, the entries gone without a match of ours are all reported
+        gone = [index for index, operation in deletes if operation["id"] not in current]
+        unmatched.update(index for index, operation in deletes if operation["id"] in current)
+        if len(gone) > removed:
+            unmatched.update(gone)
+        return unmatched
+
+    async def list_page(
+        self,
+        category: Optional[str],
+        after: Optional[Tuple[datetime, str]],
+        limit: int,
+        projection: Optional[dict] = None,
+    ) -> List[dict]:
+        query = {}
+        if category:
+            query["category"] = category
+        if after:
+            created_at, entry_id = after
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "id": {"$lt": entry_id}},
+            ]
+        results = self.collection.find(query, _without_id(projection)).sort([("created_at", -1), ("id", -1)]).limit(limit)
+        return await results.to_list(length=limit)
+
+    async def find_by_category(self, category: str, projection: Optional[dict] = None) -> List[dict]:
+        results = self.collection.find({"category": category}, _without_id(projection))
+        return await results.to_list(length=None)
+
+    async def recategorize(self, category: str, new_category: str, updated_at: datetime) -> int:
+        result = await self.collection.update_many(
+            {"category": category},
+            {"$set": {"category": new_category, "updated_at": updated_at}, "$inc": {"rev": 1}}
+        )
+        return result.modified_count
+
+    async def iter_entries(self, projection: Optional[dict] = None, changed_since: Optional[datetime] = None):
+        query = {}
+        if changed_since is not None:
+            query["updated_at"] = {"$gte": changed_since}
+        async for entry in self.collection.find(query, _without_id(projection)):
+            yield entry
+
+    async def iter_inline_attachments(self):
+        query = {"attachments.file_data": {"$type": "string"}}
+        async for entry in self.collection.find(query, {"_id": 0, "id": 1, "attachments": 1}):
+            yield entry
+
+    async def set_attachments(self, entry_id: str, attachments: List[dict]) -> None:
+        await self.collection.update_one({"id": entry_id}, {"$set": {"attachments": attachments}, "$inc": {"rev": 1}})
+
+    async def count(self) -> int:
+        return await self.collection.count_documents({})
+
+    async def entry_ids(self) -> List[str]:
+        return await self.collection.distinct("id")
+
+    async def categories(self) -> List[str]:
+        return await self.collection.distinct("category")
+
+    async def count_attachments(self) -> int:
+        pipeline = [{"$group": {"_id": None, "total": {"$sum": {"$size": {"$ifNull": ["$attachments", []]}}}}}]
+        async for result in self.collection.aggregate(pipeline):
+            return result["total"]
+        return 0
+
+    async def stats_totals(self) -> dict:
+        pipeline = [{"$facet": {
+            "categories": [{"$group": {"_id": "$category", "count": {"$sum": 1}}}],
+            "attachment_types": [
+                {"$unwind": "$attachments"},
+                {"$group": {
+                    "_id": "$attachments.file_type",
+                    "count": {"$sum": 1},
+                    "bytes": {"$sum": {"$ifNull": ["$attachments.file_size", 0]}},
+                }},
+            ],
+        }}]
+        async for result in self.collection.aggregate(pipeline):
+            return {
+                "categories": {group["_id"]: group["count"] for group in result["categories"]},
+                "attachment_types": {
+                    group["_id"]: {"count": group["count"], "bytes": group["bytes"]}
+                    for group in result["attachment_types"]
+                },
+            }
+        return {"categories": {}, "attachment_types": {}}
+
+    def watch(self, projection: dict):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        return self.collection.watch(pipeline, full_document="updateLookup")
+
+
+class MongoCategoryRepository(CategoryRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, category: dict) -> None:
+        await self.collection.insert_one(dict(category))
+
+    async def insert_many(self, categories: List[dict]) -> None:
+        await self.collection.insert_many([dict(category) for category in categories])
+
+    async def get(self, category_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": category_id}, {"_id": 0})
+
+    async def get_by_name(self, name: str) -> Optional[dict]:
+        return await self.collection.find_one({"name": name}, {"_id": 0})
+
+    async def list_all(self) -> List[dict]:
+        return await self.collection.find({}, {"_id": 0}).to_list(length=None)
+
+    async def delete(self, category_id: str) -> bool:
+        result = await self.collection.delete_one({"id": category_id})
+        return result.deleted_count > 0
+
+    async def count(self) -> int:
+        return await self.collection.count_documents({})
+
+
+def _catalog_rows(entry_id: str, attachments: List[dict]) -> List[dict]:
+    rows = {
+        attachment["id"]: dict(attachment, entry_id=entry_id, blobs=attachment_blobs(attachment))
+        for attachment in attachments
+    }
+    return list(rows.values())
+
+
+class MongoAttachmentRepository(AttachmentRepository):
+    # Rows inserted per round trip while rebuilding
+    REBUILD_BATCH_SIZE = 1000
+
+    def __init__(self, collection, holds):
+        self.collection = collection
+        # One document per held blob key, expired by a TTL index on held_at
+        self.holds = holds
+
+    async def get(self, file_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": file_id}, {"_id": 0})
+
+    async def set_for_entry(self, entry_id: str, attachments: List[dict]) -> Set[str]:
+        return await self.set_for_entries({entry_id: attachments})
+
+    async def set_for_entries(self, attachments_by_entry: Dict[str, List[dict]]) -> Set[str]:
+        if not attachments_by_entry:
+            return set()
+        kept = {
+            (entry_id, attachment["id"])
+            for entry_id, attachments in attachments_by_entry.items()
+            for attachment in attachments
+        }
+        previous = await self.collection.find(
+            {"entry_id": {"$in": list(attachments_by_entry)}}, {"_id": 1, "entry_id": 1, "id": 1, "blobs": 1}
+        ).to_list(length=None)
+        dropped = [row["_id"] for row in previous if (row["entry_id"], row["id"]) not in kept]
+        if dropped:
+            await self.collection.delete_many({"_id": {"$in": dropped}})
+        if kept:
+            rows = [
+                row for entry_id, attachments in attachments_by_entry.items()
+                for row in _catalog_rows(entry_id, attachments)
+            ]
+            await self.collection.bulk_write([
+                ReplaceOne({"entry_id": row["entry_id"], "id": row["id"]}, row, upsert=True) for row in rows
+            ], ordered=False)
+            # Referenced now, so deleting the entry later releases them
+            await self.holds.delete_many({"_id": {"$in": list({key for row in rows for key in row["blobs"]})}})
+        return await self._released({key for row in previous for key in row.get("blobs", [])})
+
+    async def _released(self, candidates: Set[str]) -> Set[str]:
+        """Blob keys among ``candidates`` that no catalogued attachment refers to and that are not held"""
+        if not candidates:
+            return set()
+        referenced = set(await self.collection.distinct("blobs", {"blobs": {"$in": list(candidates)}}))
+        # The TTL monitor only runs once a minute
+        held = self.holds.find({"_id": {"$in": list(candidates)}, "held_at": {"$gt": datetime.utcnow() - BLOB_HOLD}})
+        referenced.update([hold["_id"] async for hold in held])
+        return candidates - referenced
+
+    async def delete_for_entry(self, entry_id: str) -> Set[str]:
+        return await self.set_for_entries({entry_id: []})
+
+    async def hold_blobs(self, keys: Iterable[str]) -> None:
+        held_at = datetime.utcnow()
+        operations = [UpdateOne({"_id": key}, {"$set": {"held_at": held_at}}, upsert=True) for key in set(keys)]
+        if operations:
+            await self.holds.bulk_write(operations, ordered=False)
+
+    async def rebuild(self, entries: AsyncIterator[dict]) -> None:
+        # Built aside and renamed over the catalog, which other workers keep using meanwhile
+        staging = self.collection.database[f"{self.collection.name}_rebuild_{uuid.uuid4().hex}"]
+        try:
+            await staging.create_indexes(INDEXES[self.collection.name])
+            rows = []
+            async for entry in entries:
+                rows.extend(_catalog_rows(entry["id"], entry.get("attachments") or []))
+                if len(rows) >= self.REBUILD_BATCH_SIZE:
+                    await staging.insert_many(rows)
+                    rows = []
+            if rows:
+                await staging.insert_many(rows)
+            await staging.rename(self.collection.name, dropTarget=True)
+        except BaseException:
+            await staging.drop()
+            raise
+
+    async def count(self) -> int:
+        return await self.collection.count_documents({})
+
+    async def count_without_blobs(self) -> int:
+        return await self.collection.count_documents({"blobs": {"$exists": False}})
+
+
+class MongoStatsRepository(StatsRepository):
+    """One document per counter, so names never end up in field paths"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def apply(self, delta: Dict[str, int]) -> None:
+        if delta:
+            await self.collection.bulk_write([
+                UpdateOne({"_id": name}, {"$inc": {"value": value}}, upsert=True)
+                for name, value in delta.items()
+            ], ordered=False)
+
+    async def get_all(self) -> Dict[str, int]:
+        return {counter["_id"]: counter["value"] async for counter in self.collection.find({})}
+
+    async def delete_zero(self) -> None:
+        # A counter incremented again afterwards is simply upserted anew
+        await self.collection.delete_many({"value": 0})
+
+
+class MongoStorage(Storage):
+    def __init__(self, db=mongo_db):
+        self.db = db
+        self.entries = MongoKnowledgeRepository(db.knowledge_base)
+        self.categories = MongoCategoryRepository(db.categories)
+        self.files = MongoAttachmentRepository(db.files, db.blob_holds)
+        self.stats = MongoStatsRepository(db.stats)
+        self.meta = db.meta
+
+    async def category_overview(self) -> List[dict]:
+        counter_prefix = "category:"
+        pipeline = [
+            {"$project": {
+                "_id": 0, "name": 1, "id": 1, "icon": 1, "color": 1, "description": 1,
+                "entry_count": {"$literal": 0},
+            }},
+            {"$unionWith": {"coll": "stats", "pipeline": [
+                {"$match": {"_id": {"$regex": f"^{counter_prefix}"}, "value": {"$gt": 0}}},
+                {"$project": {
+                    "_id": 0,
+                    "name": {"$substrCP": ["$_id", len(counter_prefix), {"$strLenCP": "$_id"}]},
+                    "entry_count": "$value",
+                }},
+            ]}},
+            # $max skips missing fields, so registry metadata wins over counter-only rows
+            {"$group": {
+                "_id": "$name",
+                "id": {"$max": "$id"},
+                "icon": {"$max": "$icon"},
+                "color": {"$max": "$color"},
+                "description": {"$max": "$description"},
+                "entry_count": {"$sum": "$entry_count"},
+            }},
+            {"$sort": {"_id": 1}},
+            {"$project": {
+                "_id": 0, "name": "$_id", "id": 1, "icon": 1, "color": 1, "description": 1, "entry_count": 1,
+            }},
+        ]
+        results = self.db.categories.aggregate(pipeline, collation={"locale": "de"})
+        return await results.to_list(length=None)
+
+    async def content_version(self) -> int:
+        meta = await self.meta.find_one({"_id": "content_version"})
+        return meta["value"] if meta else 0
+
+    async def bump_content_version(self) -> int:
+        meta = await self.meta.find_one_and_update(
+            {"_id": "content_version"},
+            {"$inc": {"value": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return meta["value"]
+
+    async def acquire_lease(self, name: str, owner: str, duration: timedelta) -> bool:
+        now = datetime.utcnow()
+        try:
+            # Matches a lease that is free to take; otherwise the upsert collides on _id
+            await self.meta.update_one(
+                {"_id": f"lease:{name}", "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": owner, "expires_at": now + duration}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release_lease(self, name: str, owner: str) -> None:
+        await self.meta.delete_one({"_id": f"lease:{name}", "owner": owner})
+
+    async def ensure_indexes(self) -> dict:
+        return await ensure_indexes(self.db)
+
+    async def index_usage(self) -> dict:
+        return await index_usage(self.db)
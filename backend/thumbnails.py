@@ -0,0 +1,100 @@
+"""Thumbnail renditions of image attachments.
+
+Resizing and encoding run in a process pool so large photos never block the
+event loop. Each rendition is stored as its own blob and served by URL.
+"""
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+# Bounding boxes in pixels
+RENDITION_SIZES = (64, 200, 800)
+# Output formats in order of preference, with their encoder settings
+RENDITION_FORMATS = {
+    "avif": ("image/avif", {"quality": 60}),
+    "webp": ("image/webp", {"quality": 80}),
+    "jpeg": ("image/jpeg", {"quality": 85, "optimize": True}),
+}
+
+
+def available_formats() -> list:
+    """Rendition formats the installed Pillow can encode (JPEG always)"""
+    Image.init()
+    return [fmt for fmt in RENDITION_FORMATS if fmt.upper() in Image.SAVE]
+
+
+def _load(source: Union[str, bytes], box: Tuple[int, int]) -> Image.Image:
+    """Decoded RGB image, at reduced scale where the format allows it"""
+    image = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    # JPEG can decode at 1/2, 1/4 or 1/8 scale, far cheaper than a full decode
+    image.draft("RGB", box)
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=fmt.upper(), **RENDITION_FORMATS[fmt][1])
+    return output.getvalue()
+
+
+def render_renditions(source: Union[str, bytes], sizes=RENDITION_SIZES) -> Dict[str, Dict[str, bytes]]:
+    """Encoded renditions by size and format, from a file path or bytes"""
+    image = _load(source, (max(sizes), max(sizes)))
+    formats = available_formats()
+    renditions = {}
+    # Largest first, each smaller size is resized from the previous one
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        renditions[str(size)] = {fmt: _encode(image, fmt) for fmt in formats}
+    return renditions
+
+
+def render_image(source: Union[str, bytes], width: Optional[int], height: Optional[int], fmt: str) -> bytes:
+    """One image scaled to fit width x height (never enlarged), either may be None"""
+    with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as probe:
+        box = (width or probe.width, height or probe.height)
+    image = _load(source, box)
+    image.thumbnail(box, Image.Resampling.LANCZOS)
+    return _encode(image, fmt)
+
+
+class ThumbnailRenderer:
+    """Bounded job queue in front of a process pool.
+
+    At most ``max_pending`` jobs are handed to the pool at once; further
+    callers wait on the event loop instead of piling up in the pool.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: Optional[int] = None):
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self._pool = None
+        self._pending = None
+
+    async def _run(self, func, *args):
+        if self._pool is None:
+            # Spawned rather than forked: the server already runs threads (Motor's
+            # monitors, executor threads) whose locks a forked child may inherit held
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            # Created here so it belongs to the running event loop
+            self._pending = asyncio.Semaphore(self.max_pending)
+        async with self._pending:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    async def render(self, source: Union[str, bytes]) -> Dict[str, Dict[str, bytes]]:
+        return await self._run(render_renditions, source)
+
+    async def resize(self, source: Union[str, bytes], width: Optional[int], height: Optional[int], fmt: str) -> bytes:
+        return await self._run(render_image, source, width, height, fmt)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
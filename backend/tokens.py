@@ -0,0 +1,108 @@
+"""Verified-token cache and token revocation.
+
+Tokens that passed the signature check are remembered by the SHA-256 of
+the token until their ``exp``, so repeated admin requests skip the HMAC
+and JSON decoding. Revoked tokens are listed by their ``jti`` until they
+would have expired anyway; the list is checked on every request, cached or
+not.
+
+TOKEN_REVOCATION selects where the revocation list lives: ``local``
+(default, per process) or ``redis`` (shared between workers, needs the
+``redis`` package and REDIS_URL).
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def token_id(token: str, payload: dict) -> str:
+    """Revocation key: the jti claim, or the token hash for tokens without one"""
+    return payload.get("jti") or token_hash(token)
+
+
+class VerifiedTokenCache:
+    """LRU of decoded payloads of valid tokens, each kept until its exp"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = token_hash(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, payload = entry
+        if expires <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def put(self, token: str, payload: dict) -> None:
+        if self.max_entries <= 0 or "exp" not in payload:
+            return
+        key = token_hash(token)
+        self._entries[key] = (float(payload["exp"]), payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, token: str) -> None:
+        self._entries.pop(token_hash(token), None)
+
+
+class RevocationList:
+    async def revoke(self, token_id: str, expires_at: float) -> None:
+        raise NotImplementedError
+
+    async def is_revoked(self, token_id: str) -> bool:
+        raise NotImplementedError
+
+
+class LocalRevocationList(RevocationList):
+    def __init__(self):
+        self._revoked: Dict[str, float] = {}
+
+    async def revoke(self, token_id: str, expires_at: float) -> None:
+        now = time.time()
+        # Expired tokens are rejected anyway, no need to remember them
+        self._revoked = {key: expires for key, expires in self._revoked.items() if expires > now}
+        if expires_at > now:
+            self._revoked[token_id] = expires_at
+
+    async def is_revoked(self, token_id: str) -> bool:
+        expires = self._revoked.get(token_id)
+        return expires is not None and expires > time.time()
+
+
+class RedisRevocationList(RevocationList):
+    """Shared revocation list; Redis drops each key when its token expires"""
+
+    def __init__(self, url: str, prefix: str = "wiki:revoked:"):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def revoke(self, token_id: str, expires_at: float) -> None:
+        if expires_at > time.time():
+            await self.client.set(self.prefix + token_id, 1, exat=int(expires_at) + 1)
+
+    async def is_revoked(self, token_id: str) -> bool:
+        return bool(await self.client.exists(self.prefix + token_id))
+
+
+def create_revocation_list() -> RevocationList:
+    """Revocation list configured via TOKEN_REVOCATION"""
+    backend = os.environ.get("TOKEN_REVOCATION", "local").lower()
+    if backend == "local":
+        return LocalRevocationList()
+    if backend == "redis":
+        return RedisRevocationList(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    raise ValueError(f"Unknown TOKEN_REVOCATION backend: {backend}")
@@ -4,6 +4,7 @@ Comprehensive Backend API Tests for Böttcher Wiki Knowledge Base System
 Tests all knowledge base functions, search, categories, stats, CRUD operations, and database integration
 """
 
+import os
 import requests
 import json
 import uuid
@@ -11,7 +12,7 @@ from datetime import datetime
 import time
 
 # Get backend URL from environment
-BACKEND_URL = "https://5f463c4f-105f-4102-90ec-a413bdeb91a6.preview.emergentagent.com/api"
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
 
 class BöttcherWikiKnowledgeBaseTester:
     def __init__(self):
@@ -263,6 +264,39 @@ class BöttcherWikiKnowledgeBaseTester:
                 
         return success_count >= 3  # Allow some flexibility
         
+    def test_search_suggest(self):
+        """Test GET /api/search/suggest - Prefix and typo-tolerant suggestions"""
+        suggest_tests = [
+            {"q": "Scan", "expected_text": "scanner"},
+            {"q": "schweisen", "expected_text": "schweiß"},
+            {"q": "Wartungsinterv", "expected_text": "wartungsintervalle"}
+        ]
+        
+        success_count = 0
+        for i, suggest_test in enumerate(suggest_tests):
+            try:
+                response = requests.get(
+                    f"{self.base_url}/search/suggest",
+                    params={"q": suggest_test["q"], "limit": 5},
+                    timeout=10
+                )
+                
+                if response.status_code == 200:
+                    suggestions = response.json().get("suggestions", [])
+                    texts = [suggestion.get("text", "").lower() for suggestion in suggestions]
+                    if len(suggestions) <= 5 and any(suggest_test["expected_text"] in text for text in texts):
+                        success_count += 1
+                        self.log_test(f"Suggest Test {i+1}", True, f"'{suggest_test['q']}' suggested {texts}")
+                    else:
+                        self.log_test(f"Suggest Test {i+1}", False, f"Unexpected suggestions for '{suggest_test['q']}': {texts}")
+                else:
+                    self.log_test(f"Suggest Test {i+1}", False, f"Status code: {response.status_code}")
+                    
+            except Exception as e:
+                self.log_test(f"Suggest Test {i+1}", False, f"Error: {str(e)}")
+                
+        return success_count == len(suggest_tests)
+        
     def test_get_categories(self):
         """Test GET /api/categories - Get all available categories"""
         try:
@@ -317,6 +351,122 @@ class BöttcherWikiKnowledgeBaseTester:
             self.log_test("Get Stats", False, f"Error: {str(e)}")
         return False
         
+    def test_stats_etag(self):
+        """Test GET /api/stats - Revalidation with If-None-Match returns 304"""
+        try:
+            response = requests.get(f"{self.base_url}/stats", timeout=10)
+            etag = response.headers.get("ETag")
+            if response.status_code != 200 or not etag:
+                self.log_test("Stats ETag", False, f"Missing ETag, status code: {response.status_code}")
+                return False
+            
+            revalidation = requests.get(f"{self.base_url}/stats", headers={"If-None-Match": etag}, timeout=10)
+            if revalidation.status_code == 304 and not revalidation.content:
+                self.log_test("Stats ETag", True, f"ETag {etag} revalidated with 304")
+                return True
+            else:
+                self.log_test("Stats ETag", False, f"Expected 304, got {revalidation.status_code}")
+                
+        except Exception as e:
+            self.log_test("Stats ETag", False, f"Error: {str(e)}")
+        return False
+        
+    def test_response_compression(self):
+        """Test GET /api/knowledge - gzip Content-Encoding when accepted"""
+        try:
+            response = requests.get(f"{self.base_url}/knowledge", headers={"Accept-Encoding": "gzip"}, timeout=10)
+            encoding = response.headers.get("Content-Encoding")
+            if response.status_code == 200 and encoding == "gzip" and isinstance(response.json(), list):
+                self.log_test("Response Compression", True, f"List served with Content-Encoding {encoding}")
+                return True
+            else:
+                self.log_test("Response Compression", False, f"Status code: {response.status_code}, Content-Encoding: {encoding}")
+                
+        except Exception as e:
+            self.log_test("Response Compression", False, f"Error: {str(e)}")
+        return False
+        
+    def test_export_import(self):
+        """Test POST /api/import and GET /api/export - NDJSON round trip with upsert by id"""
+        entry_ids = [f"import-test-{uuid.uuid4()}" for _ in range(2)]
+        body = "\n".join(json.dumps({
+            "id": entry_id,
+            "question": f"Importierte Testfrage {number}",
+            "answer": "Über den NDJSON-Import angelegt",
+            "category": "IT-Support",
+            "tags": ["import"],
+            # Offsets are stored as naive UTC like all other timestamps
+            "created_at": "2024-01-01T00:00:00Z"
+        }) for number, entry_id in enumerate(entry_ids))
+        headers = {"Authorization": self.get_auth_headers().get("Authorization", ""), "Content-Type": "application/x-ndjson"}
+        
+        try:
+            first = requests.post(f"{self.base_url}/import", data=body.encode("utf-8"), headers=headers, timeout=30)
+            second = requests.post(f"{self.base_url}/import", data=body.encode("utf-8"), headers=headers, timeout=30)
+            export = requests.get(f"{self.base_url}/export", headers=headers, timeout=60)
+            exported = {entry["id"]: entry for entry in (json.loads(line) for line in export.text.splitlines() if line.strip())}
+            exported_ids = set(exported)
+            
+            if first.status_code != 200 or first.json().get("created") != 2:
+                self.log_test("Export/Import", False, f"Import: {first.status_code} {first.text[:200]}")
+            elif second.status_code != 200 or second.json().get("updated") != 2:
+                self.log_test("Export/Import", False, f"Re-import did not update by id: {second.text[:200]}")
+            elif export.status_code != 200 or not set(entry_ids) <= exported_ids:
+                self.log_test("Export/Import", False, f"Imported entries missing in export, status code: {export.status_code}")
+            elif exported[entry_ids[0]].get("created_at") != "2024-01-01T00:00:00":
+                self.log_test("Export/Import", False, f"created_at not normalized to UTC: {exported[entry_ids[0]].get('created_at')}")
+            else:
+                self.log_test("Export/Import", True, f"2 entries imported, updated by id and exported ({len(exported_ids)} lines)")
+                return True
+                
+        except Exception as e:
+            self.log_test("Export/Import", False, f"Error: {str(e)}")
+        finally:
+            for entry_id in entry_ids:
+                requests.delete(f"{self.base_url}/knowledge/{entry_id}", headers=self.get_auth_headers(), timeout=10)
+        return False
+        
+    def test_batch_operations(self):
+        """Test POST /api/knowledge/batch - create, move and delete in one request"""
+        try:
+            response = requests.post(
+                f"{self.base_url}/knowledge/batch",
+                json={"operations": [
+                    {"op": "create", "entry": {"question": "Batch-Testfrage", "answer": "Batch-Antwort", "category": "IT-Support"}},
+                    {"op": "delete", "id": f"missing-{uuid.uuid4()}"}
+                ], "ordered": False},
+                headers=self.get_auth_headers(),
+                timeout=10
+            )
+            if response.status_code != 200:
+                self.log_test("Batch Operations", False, f"Status code: {response.status_code}")
+                return False
+            results = response.json()["results"]
+            if [result["status"] for result in results] != [201, 404]:
+                self.log_test("Batch Operations", False, f"Unexpected results: {results}")
+                return False
+            
+            entry_id = results[0]["id"]
+            cleanup = requests.post(
+                f"{self.base_url}/knowledge/batch",
+                json={"operations": [
+                    {"op": "move", "id": entry_id, "category": "Schulung"},
+                    {"op": "delete", "id": entry_id}
+                ]},
+                headers=self.get_auth_headers(),
+                timeout=10
+            )
+            statuses = [result["status"] for result in cleanup.json()["results"]]
+            if cleanup.status_code == 200 and statuses == [200, 200]:
+                self.log_test("Batch Operations", True, "Create, move and delete applied with per-item results")
+                return True
+            else:
+                self.log_test("Batch Operations", False, f"Move/delete results: {statuses}")
+                
+        except Exception as e:
+            self.log_test("Batch Operations", False, f"Error: {str(e)}")
+        return False
+        
     def test_update_knowledge_entry(self):
         """Test PUT /api/knowledge/{id} - Update existing entries"""
         if not self.created_entry_ids:
@@ -354,6 +504,67 @@ class BöttcherWikiKnowledgeBaseTester:
             self.log_test("Update Knowledge Entry", False, f"Error: {str(e)}")
         return False
         
+    def test_patch_knowledge_entry(self):
+        """Test PATCH /api/knowledge/{id} - Merge patch changes only the sent fields"""
+        if not self.created_entry_ids:
+            self.log_test("Patch Knowledge Entry", False, "No entries available to patch")
+            return False
+            
+        entry_id = self.created_entry_ids[0]
+        try:
+            before = requests.get(f"{self.base_url}/knowledge/{entry_id}", timeout=10).json()
+            headers = dict(self.get_auth_headers(), **{"Content-Type": "application/merge-patch+json"})
+            response = requests.patch(
+                f"{self.base_url}/knowledge/{entry_id}",
+                data=json.dumps({"answer": "Per PATCH geänderte Antwort"}),
+                headers=headers,
+                timeout=10
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                unchanged = all(data.get(field) == before.get(field) for field in ("question", "category", "tags", "created_at"))
+                if data.get("answer") == "Per PATCH geänderte Antwort" and unchanged:
+                    self.log_test("Patch Knowledge Entry", True, f"Only the answer of {entry_id} changed")
+                    return True
+                else:
+                    self.log_test("Patch Knowledge Entry", False, f"Unexpected entry after patch: {data}")
+            else:
+                self.log_test("Patch Knowledge Entry", False, f"Status code: {response.status_code}, Response: {response.text}")
+                
+        except Exception as e:
+            self.log_test("Patch Knowledge Entry", False, f"Error: {str(e)}")
+        return False
+        
+    def test_conditional_update(self):
+        """Test If-Match on PATCH /api/knowledge/{id} - Stale revisions are rejected with 412"""
+        if not self.created_entry_ids:
+            self.log_test("Conditional Update", False, "No entries available to update")
+            return False
+            
+        entry_id = self.created_entry_ids[0]
+        try:
+            current = requests.get(f"{self.base_url}/knowledge/{entry_id}", timeout=10)
+            etag = current.headers.get("ETag")
+            if etag != f'W/"{current.json().get("rev")}"':
+                self.log_test("Conditional Update", False, f"ETag {etag} does not match rev {current.json().get('rev')}")
+                return False
+            
+            headers = dict(self.get_auth_headers(), **{"If-Match": etag})
+            first = requests.patch(f"{self.base_url}/knowledge/{entry_id}", json={"answer": "Erste Änderung"}, headers=headers, timeout=10)
+            second = requests.patch(f"{self.base_url}/knowledge/{entry_id}", json={"answer": "Veraltete Änderung"}, headers=headers, timeout=10)
+            after = requests.get(f"{self.base_url}/knowledge/{entry_id}", timeout=10).json()
+            
+            if first.status_code == 200 and second.status_code == 412 and after.get("answer") == "Erste Änderung":
+                self.log_test("Conditional Update", True, f"Revision {after.get('rev')}, stale write rejected")
+                return True
+            else:
+                self.log_test("Conditional Update", False, f"Status codes: {first.status_code}, {second.status_code}, answer: {after.get('answer')}")
+                
+        except Exception as e:
+            self.log_test("Conditional Update", False, f"Error: {str(e)}")
+        return False
+        
     def test_delete_knowledge_entry(self):
         """Test DELETE /api/knowledge/{id} - Delete entries"""
         if not self.created_entry_ids:
@@ -875,9 +1086,16 @@ class BöttcherWikiKnowledgeBaseTester:
             ("Get All Knowledge", self.test_get_all_knowledge),
             ("Category Filtering", self.test_category_filtering),
             ("Search Functionality", self.test_search_functionality),
+            ("Search Suggestions", self.test_search_suggest),
             ("Get Categories", self.test_get_categories),
             ("Get Statistics", self.test_get_stats),
+            ("Stats ETag", self.test_stats_etag),
+            ("Response Compression", self.test_response_compression),
+            ("Export/Import", self.test_export_import),
+            ("Batch Operations", self.test_batch_operations),
             ("Update Knowledge Entry", self.test_update_knowledge_entry),
+            ("Patch Knowledge Entry", self.test_patch_knowledge_entry),
+            ("Conditional Update", self.test_conditional_update),
             ("Delete Knowledge Entry", self.test_delete_knowledge_entry),
             ("Edge Cases", self.test_edge_cases),
             ("Data Persistence", self.test_data_persistence),
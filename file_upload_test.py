@@ -14,7 +14,7 @@ from PIL import Image
 import os
 
 # Get backend URL from environment
-BACKEND_URL = "https://5f463c4f-105f-4102-90ec-a413bdeb91a6.preview.emergentagent.com/api"
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
 
 class FileUploadTester:
     def __init__(self):
@@ -168,11 +168,11 @@ startxref
             
             if response.status_code == 200:
                 data = response.json()
-                required_fields = ['id', 'filename', 'file_type', 'file_size', 'content_type', 'file_data', 'uploaded_at']
+                required_fields = ['id', 'filename', 'file_type', 'file_size', 'content_type', 'sha256', 'uploaded_at']
                 
                 if all(field in data for field in required_fields):
-                    # Check if thumbnail was generated for image
-                    if data.get('thumbnail') and data.get('file_type') == 'images':
+                    # Check if thumbnail renditions were generated for image
+                    if data.get('thumbnails') and data.get('file_type') == 'images':
                         self.uploaded_files.append(data)
                         self.log_test("Upload Image File", True, f"Successfully uploaded image with thumbnail. ID: {data['id']}")
                         return True
@@ -210,11 +210,11 @@ startxref
             
             if response.status_code == 200:
                 data = response.json()
-                required_fields = ['id', 'filename', 'file_type', 'file_size', 'content_type', 'file_data', 'uploaded_at']
+                required_fields = ['id', 'filename', 'file_type', 'file_size', 'content_type', 'sha256', 'uploaded_at']
                 
                 if all(field in data for field in required_fields):
                     # PDF should not have thumbnail
-                    if data.get('file_type') == 'documents' and not data.get('thumbnail'):
+                    if data.get('file_type') == 'documents' and not data.get('thumbnails'):
                         self.uploaded_files.append(data)
                         self.log_test("Upload PDF File", True, f"Successfully uploaded PDF. ID: {data['id']}")
                         return True
@@ -442,6 +442,38 @@ startxref
             self.log_test("File Download", False, f"Error: {str(e)}")
         return False
         
+    def test_file_download_range_and_etag(self):
+        """Test byte-range downloads and conditional GET with the ETag"""
+        if not self.uploaded_files:
+            self.log_test("Download Range and ETag", False, "No uploaded files to download")
+            return False
+            
+        try:
+            file_id = self.uploaded_files[0]['id']
+            url = f"{self.base_url}/files/{file_id}/download"
+            
+            full = requests.get(url, timeout=10)
+            etag = full.headers.get('ETag')
+            if full.status_code != 200 or not etag or full.headers.get('Accept-Ranges') != 'bytes':
+                self.log_test("Download Range and ETag", False, f"Missing ETag or Accept-Ranges: {full.headers}")
+                return False
+            
+            partial = requests.get(url, headers={'Range': 'bytes=0-9'}, timeout=10)
+            if partial.status_code != 206 or partial.content != full.content[:10]:
+                self.log_test("Download Range and ETag", False, f"Expected 206 with first 10 bytes, got {partial.status_code}")
+                return False
+            
+            cached = requests.get(url, headers={'If-None-Match': etag}, timeout=10)
+            if cached.status_code == 304:
+                self.log_test("Download Range and ETag", True, f"Range: {partial.headers.get('Content-Range')}, revalidation returned 304")
+                return True
+            else:
+                self.log_test("Download Range and ETag", False, f"Expected 304, got {cached.status_code}")
+                
+        except Exception as e:
+            self.log_test("Download Range and ETag", False, f"Error: {str(e)}")
+        return False
+        
     def test_download_nonexistent_file(self):
         """Test downloading non-existent file (should return 404)"""
         try:
@@ -557,6 +589,7 @@ startxref
             ("Knowledge Entry with Attachments", self.test_create_knowledge_entry_with_attachments),
             ("Retrieve Knowledge with Attachments", self.test_retrieve_knowledge_with_attachments),
             ("File Download", self.test_file_download),
+            ("Download Range and ETag", self.test_file_download_range_and_etag),
             ("Download Non-existent File", self.test_download_nonexistent_file),
             ("Stats Include Attachments", self.test_stats_include_attachments)
         ]
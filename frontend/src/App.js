@@ -5,9 +5,13 @@ const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001'
 
 function App() {
   const [knowledgeEntries, setKnowledgeEntries] = useState([]);
+  // Request for the next page of the shown list: { path, body, cursor } or null
+  const [nextPage, setNextPage] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchQuery, setSearchQuery] = useState('');
   const [selectedCategory, setSelectedCategory] = useState('');
   const [categories, setCategories] = useState([]);
+  const [categoryInfo, setCategoryInfo] = useState({});
   const [detailedCategories, setDetailedCategories] = useState([]);
   const [stats, setStats] = useState({});
   const [showAddEntry, setShowAddEntry] = useState(false);
@@ -81,21 +85,56 @@ function App() {
     }
   };
 
+  // Lists are paged; the cursor of the next page comes in the X-Next-Cursor header
+  const fetchPage = async (path, body, cursor) => {
+    let url = `${BACKEND_URL}${path}`;
+    if (cursor) {
+      url += `${path.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(cursor)}`;
+    }
+    const response = await fetch(url, body ? {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body)
+    } : undefined);
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}`);
+    }
+    const data = await response.json();
+    const nextCursor = response.headers.get('X-Next-Cursor');
+    setNextPage(nextCursor ? { path, body, cursor: nextCursor } : null);
+    return data;
+  };
+
   const fetchKnowledgeEntries = async () => {
     try {
-      const response = await fetch(`${BACKEND_URL}/api/knowledge`);
-      const data = await response.json();
+      const data = await fetchPage('/api/knowledge');
       setKnowledgeEntries(data);
     } catch (error) {
       console.error('Error fetching knowledge entries:', error);
     }
   };
 
+  const loadMoreEntries = async () => {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    try {
+      const data = await fetchPage(nextPage.path, nextPage.body, nextPage.cursor);
+      setKnowledgeEntries(entries => [...entries, ...data]);
+    } catch (error) {
+      console.error('Error loading more entries:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const fetchCategories = async () => {
     try {
       const response = await fetch(`${BACKEND_URL}/api/categories`);
       const data = await response.json();
       setCategories(data.categories);
+      setCategoryInfo(Object.fromEntries((data.items || []).map(item => [item.name, item])));
     } catch (error) {
       console.error('Error fetching categories:', error);
     }
@@ -159,7 +198,19 @@ function App() {
     }
   };
 
-  const handleLogout = () => {
+  const handleLogout = async () => {
+    const token = localStorage.getItem('admin_token');
+    if (token) {
+      try {
+        // Revoke the token on the server, not just locally
+        await fetch(`${BACKEND_URL}/api/admin/logout`, {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${token}` }
+        });
+      } catch (error) {
+        console.error('Error logging out:', error);
+      }
+    }
     localStorage.removeItem('admin_token');
     setIsAdmin(false);
     setAdminUser('');
@@ -173,17 +224,10 @@ function App() {
     
     setLoading(true);
     try {
-      const response = await fetch(`${BACKEND_URL}/api/search`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          query: searchQuery,
-          category: selectedCategory || null
-        })
+      const data = await fetchPage('/api/search', {
+        query: searchQuery,
+        category: selectedCategory || null
       });
-      const data = await response.json();
       setKnowledgeEntries(data);
     } catch (error) {
       console.error('Error searching knowledge:', error);
@@ -197,8 +241,7 @@ function App() {
     setSearchQuery('');
     if (category) {
       setLoading(true);
-      fetch(`${BACKEND_URL}/api/knowledge?category=${category}`)
-        .then(response => response.json())
+      fetchPage(`/api/knowledge?category=${encodeURIComponent(category)}`)
         .then(data => {
           setKnowledgeEntries(data);
           setLoading(false);
@@ -229,7 +272,7 @@ function App() {
         body: JSON.stringify({
           ...newEntry,
           tags: tagsArray,
-          attachments: uploadedFiles
+          attachments: uploadedFiles.map(({ preview, ...file }) => file)
         })
       });
       
@@ -377,6 +420,10 @@ function App() {
         
         if (response.ok) {
           const uploadedFile = await response.json();
+          // Local preview, the server thumbnails are only reachable once the entry is saved
+          if (uploadedFile.file_type === 'images') {
+            uploadedFile.preview = URL.createObjectURL(file);
+          }
           newFiles.push(uploadedFile);
         } else {
           alert(`Fehler beim Hochladen von ${file.name}`);
@@ -414,6 +461,10 @@ function App() {
   };
 
   const removeUploadedFile = (fileId) => {
+    const removed = uploadedFiles.find(file => file.id === fileId);
+    if (removed && removed.preview) {
+      URL.revokeObjectURL(removed.preview);
+    }
     setUploadedFiles(prev => prev.filter(file => file.id !== fileId));
   };
 
@@ -454,6 +505,9 @@ function App() {
   };
 
   const getCategoryIcon = (category) => {
+    if (categoryInfo[category]?.icon) {
+      return categoryInfo[category].icon;
+    }
     switch (category) {
       case 'IT-Support':
         return '💻';
@@ -628,6 +682,9 @@ function App() {
                 }`}
               >
                 {getCategoryIcon(category)} {category}
+                {categoryInfo[category] && (
+                  <span className="ml-1 text-xs opacity-75">({categoryInfo[category].entry_count})</span>
+                )}
               </button>
             ))}
           </div>
@@ -755,9 +812,9 @@ function App() {
                         <div className="flex flex-wrap gap-2">
                           {entry.attachments.map(attachment => (
                             <div key={attachment.id} className="flex items-center bg-gray-50 rounded-lg p-2 text-sm">
-                              {attachment.file_type === 'images' && attachment.thumbnail ? (
+                              {attachment.file_type === 'images' && attachment.thumbnail_url ? (
                                 <img 
-                                  src={`data:image/jpeg;base64,${attachment.thumbnail}`}
+                                  src={`${BACKEND_URL}${(attachment.thumbnail_urls && attachment.thumbnail_urls['64']) || attachment.thumbnail_url}`}
                                   alt={attachment.filename}
                                   className="w-8 h-8 rounded object-cover mr-2"
                                 />
@@ -788,6 +845,17 @@ function App() {
               </div>
             ))
           )}
+          {nextPage && (
+            <div className="text-center">
+              <button
+                onClick={loadMoreEntries}
+                disabled={loadingMore}
+                className="px-6 py-2 bg-white text-blue-600 border border-blue-600 rounded-lg hover:bg-blue-50 transition-colors disabled:opacity-50"
+              >
+                {loadingMore ? 'Laden...' : 'Mehr laden'}
+              </button>
+            </div>
+          )}
         </div>
       </div>
 
@@ -939,9 +1007,9 @@ function App() {
                     <h5 className="text-sm font-medium text-gray-700">Hochgeladene Dateien:</h5>
                     {uploadedFiles.map(file => (
                       <div key={file.id} className="flex items-center bg-gray-50 rounded-lg p-3">
-                        {file.file_type === 'images' && file.thumbnail ? (
+                        {file.file_type === 'images' && file.preview ? (
                           <img 
-                            src={`data:image/jpeg;base64,${file.thumbnail}`}
+                            src={file.preview}
                             alt={file.filename}
                             className="w-10 h-10 rounded object-cover mr-3"
                           />
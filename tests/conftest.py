@@ -0,0 +1,16 @@
+"""Unit tests for the backend modules, run against the in-memory storage backend.
+
+The backend is not a package; its modules import each other by top-level
+name, so the backend directory goes on the path first.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("UPLOAD_FOLDER", tempfile.mkdtemp(prefix="wiki-tests-"))
+os.environ.setdefault("SEARCH_RECONCILE_INTERVAL", "0")
+os.environ.setdefault("STATS_RECONCILE_INTERVAL", "0")
@@ -0,0 +1,57 @@
+import asyncio
+import os
+
+import imagecache
+from imagecache import SCAN_EVERY_PUTS, DiskLRUCache
+
+
+def counting_scans(cache):
+    scans = []
+    scan = cache._scan
+
+    def counted():
+        scans.append(1)
+        return scan()
+
+    cache._scan = counted
+    return scans
+
+
+def test_puts_below_the_bound_do_not_scan_every_time(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 1024 * 1024)
+    scans = counting_scans(cache)
+
+    async def fill():
+        for i in range(SCAN_EVERY_PUTS - 1):
+            await cache.put(f"k{i}", b"x" * 10)
+
+    asyncio.run(fill())
+    assert scans == []
+    asyncio.run(cache.put("last", b"x" * 10))
+    assert len(scans) == 1
+
+
+def test_evicts_least_recently_used_once_over_the_bound(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 100)
+
+    async def fill():
+        for i in range(3):
+            await cache.put(f"k{i}", b"x" * 40)
+            path = cache._path(cache._name(f"k{i}"))
+            os.utime(path, (i, i))
+        return [await cache.get(f"k{i}") for i in range(3)]
+
+    assert asyncio.run(fill()) == [None, b"x" * 40, b"x" * 40]
+    assert cache._scanned_bytes == 80
+
+
+def test_writes_of_other_workers_are_noticed_after_the_interval(tmp_path, monkeypatch):
+    cache = DiskLRUCache(str(tmp_path), 100)
+    other = DiskLRUCache(str(tmp_path), 100)
+    asyncio.run(other.put("theirs", b"x" * 90))
+    asyncio.run(cache.put("mine", b"y" * 5))
+    assert len(os.listdir(tmp_path)) == 2
+
+    monkeypatch.setattr(imagecache, "SCAN_INTERVAL", 0.0)
+    asyncio.run(cache.put("more", b"z" * 20))
+    assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) <= 100
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from storage.memory import MemoryStorage
+
+T0 = datetime(2024, 1, 1)
+
+
+def entry(entry_id, minutes=0, category="Wartung", **fields):
+    return dict({"id": entry_id, "question": entry_id, "answer": "", "category": category,
+                 "created_at": T0 + timedelta(minutes=minutes), "updated_at": T0, "rev": 1}, **fields)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_documents_are_copied_in_and_out():
+    entries = MemoryStorage().entries
+    document = entry("a", tags=["x"])
+    run(entries.insert(document))
+    document["tags"].append("y")
+    stored = run(entries.get("a"))
+    stored["tags"].append("z")
+    assert run(entries.get("a"))["tags"] == ["x"]
+
+
+def test_projection_includes_and_excludes_nested_fields():
+    entries = MemoryStorage().entries
+    run(entries.insert(entry("a", attachments=[{"id": "f", "file_data": "AAAA", "file_size": 3}])))
+    assert run(entries.get("a", {"id": 1, "attachments.id": 1})) == {"id": "a", "attachments": [{"id": "f"}]}
+    assert "file_data" not in run(entries.get("a", {"attachments.file_data": 0}))["attachments"][0]
+
+
+def test_list_page_is_newest_first_with_keyset_cursor():
+    entries = MemoryStorage().entries
+    run(entries.insert_many([entry(f"e{i}", minutes=i, category="IT" if i % 2 else "Wartung") for i in range(5)]))
+    first = run(entries.list_page(None, None, 2))
+    assert [item["id"] for item in first] == ["e4", "e3"]
+    after = (first[-1]["created_at"], first[-1]["id"])
+    assert [item["id"] for item in run(entries.list_page(None, after, 10))] == ["e2", "e1", "e0"]
+    assert [item["id"] for item in run(entries.list_page("IT", None, 10))] == ["e3", "e1"]
+
+
+def test_conditional_writes_check_the_revision():
+    entries = MemoryStorage().entries
+    run(entries.insert(entry("a")))
+    assert not run(entries.replace("a", entry("a", question="alt"), rev=2))
+    assert run(entries.replace("a", entry("a", question="neu", rev=2), rev=1))
+    assert run(entries.update("a", {"$inc": {"rev": 1}}, rev=1)) is None
+    assert run(entries.update("a", {"$set": {"answer": "b"}, "$inc": {"rev": 1}}, rev=2))["rev"] == 3
+    assert not run(entries.delete("a", rev=2))
+    assert run(entries.delete("a", rev=3))
+
+
+def test_bulk_write_reports_errors_and_unmatched_operations():
+    entries = MemoryStorage().entries
+    run(entries.insert(entry("a")))
+    errors, unmatched = run(entries.bulk_write([
+        {"type": "update", "id": "a", "update": {"$set": {"answer": "x"}}, "condition": {"rev": 5}},
+        {"type": "delete", "id": "missing"},
+        {"type": "insert", "entry": entry("a")},
+        {"type": "insert", "entry": entry("b")},
+    ]))
+    assert unmatched == {0, 1}
+    assert list(errors) == [2]
+    # Ordered writes stop at the first error
+    assert not run(entries.exists("b"))
+
+
+def test_recategorize_moves_entries_and_bumps_revisions():
+    entries = MemoryStorage().entries
+    run(entries.insert_many([entry("a"), entry("b", minutes=1), entry("c", category="IT")]))
+    assert run(entries.recategorize("Wartung", "Allgemein", T0)) == 2
+    assert [item["id"] for item in run(entries.find_by_category("Allgemein"))] == ["a", "b"]
+    assert run(entries.get("a"))["rev"] == 2
+    assert sorted(run(entries.categories())) == ["Allgemein", "IT"]
+
+
+def test_attachment_catalog_releases_blobs_after_the_last_reference():
+    files = MemoryStorage().files
+    attachment = {"id": "f", "sha256": "s", "thumbnails": {"200": {"webp": "t"}}}
+    assert run(files.set_for_entries({"a": [attachment], "b": [attachment]})) == set()
+    assert run(files.count()) == 2
+    assert run(files.delete_for_entry("a")) == set()
+    assert run(files.get("f"))["entry_id"] == "b"
+    assert run(files.delete_for_entry("b")) == {"s", "t"}
+    assert run(files.get("f")) is None
+
+
+def test_held_blobs_are_not_released_until_catalogued():
+    files = MemoryStorage().files
+    run(files.set_for_entry("a", [{"id": "f", "sha256": "s"}]))
+    run(files.hold_blobs(["s"]))
+    assert run(files.delete_for_entry("a")) == set()
+    # Cataloguing lifts the hold
+    run(files.set_for_entry("b", [{"id": "g", "sha256": "s"}]))
+    assert run(files.delete_for_entry("b")) == {"s"}
+
+
+def test_stats_counters_apply_increments_and_drop_zeros():
+    stats = MemoryStorage().stats
+    run(stats.apply({"entries": 2, "category:IT": 1}))
+    run(stats.apply({"category:IT": -1}))
+    run(stats.delete_zero())
+    assert run(stats.get_all()) == {"entries": 2}
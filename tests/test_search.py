@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from search import MAX_PREFIX_TERMS, SearchIndex, SearchIndexReconciler, analyze
+from storage.memory import MemoryKnowledgeRepository
+
+T0 = datetime(2024, 1, 1)
+
+
+def entry(entry_id, question, answer="", tags=(), category="Wartung", minutes=0):
+    return {"id": entry_id, "question": question, "answer": answer, "tags": list(tags),
+            "category": category, "created_at": T0 + timedelta(minutes=minutes)}
+
+
+def ids(hits):
+    return [entry_id for entry_id, _ in hits]
+
+
+def test_analyze_folds_umlauts_drops_stopwords_and_stems():
+    assert analyze("Die Prüfungen der Schweißnähte") == ["prufung", "schweissnah"]
+    assert analyze("Prüfung") == analyze("PRUFUNGEN")
+
+
+def test_question_matches_rank_above_answer_matches():
+    index = SearchIndex()
+    index.build([
+        entry("answer", "Allgemeines", answer="Kalibrierung der Waage"),
+        entry("question", "Kalibrierung der Waage"),
+    ])
+    assert ids(index.search("kalibrierung")) == ["question", "answer"]
+
+
+def test_category_filter_and_removal():
+    index = SearchIndex()
+    index.build([entry("a", "Drucker Papierstau"), entry("b", "Drucker Toner", category="IT")])
+    assert ids(index.search("drucker", category="IT")) == ["b"]
+    index.remove("b")
+    assert ids(index.search("drucker")) == ["a"]
+    assert "b" not in index
+
+
+def test_last_word_matches_as_prefix():
+    index = SearchIndex()
+    index.build([entry("a", "Schweißgerät einstellen"), entry("b", "Schrank abschließen")])
+    assert ids(index.search("schwei")) == ["a"]
+
+
+def test_prefix_expansion_keeps_the_most_frequent_completions():
+    index = SearchIndex()
+    index.build([entry(f"rare{i}", f"wort{i:03d}") for i in range(MAX_PREFIX_TERMS + 4)]
+                + [entry(f"common{i}", "wortschatz", minutes=i) for i in range(3)])
+    assert set(ids(index.search("wort"))) >= {"common0", "common1", "common2"}
+    assert len(index.search("wort")) == 3 + MAX_PREFIX_TERMS - 1
+
+
+def test_ties_break_by_newest_entry_then_id():
+    index = SearchIndex()
+    index.build([entry("a", "Pumpe", minutes=1), entry("c", "Pumpe"), entry("b", "Pumpe", minutes=1)])
+    assert ids(index.search("pumpe")) == ["b", "a", "c"]
+
+
+def test_cursor_pages_match_the_full_ranking():
+    index = SearchIndex()
+    index.build([
+        entry(f"e{i}", " ".join(["Motor"] * (i % 4 + 1)) + (" Lager" if i % 3 else ""), answer="Motor Wartung" * (i % 2),
+              minutes=i % 7)
+        for i in range(60)
+    ])
+    for query in ("motor", "motor lager", "lag"):
+        full = ids(index.search(query))
+        pages, after = [], None
+        while True:
+            page = index.search(query, limit=7, after=after)
+            if not page:
+                break
+            pages.extend(ids(page))
+            after = index.rank_key(*page[-1])
+        assert pages == full
+
+
+def test_limited_search_keeps_exact_scores():
+    index = SearchIndex()
+    index.build([entry(f"e{i}", f"Ventil {'Dichtung ' * (i % 5)}", answer="Ventil" * (i % 3), minutes=i)
+                 for i in range(40)])
+    full = index.search("ventil dichtung")
+    assert index.search("ventil dichtung", limit=10) == full[:10]
+
+
+def test_fingerprint_depends_on_contents_not_order():
+    first, second = SearchIndex(), SearchIndex()
+    entries = [entry("a", "Filter"), entry("b", "Öl")]
+    first.build(entries)
+    second.build(reversed(entries))
+    assert first.fingerprint == second.fingerprint
+    second.add(entry("b", "Öl wechseln"))
+    assert first.fingerprint != second.fingerprint
+
+
+def test_reconciler_drops_deletions_hidden_by_an_insert():
+    async def scenario():
+        repository = MemoryKnowledgeRepository()
+        await repository.insert_many([dict(entry("a", "Alt"), updated_at=T0), dict(entry("b", "Bleibt"), updated_at=T0)])
+        index = SearchIndex()
+        reconciler = SearchIndexReconciler([index], repository, {"id": 1, "question": 1, "created_at": 1},
+                                           id_diff_interval=0)
+        await reconciler.rebuild()
+        # Another worker deletes one entry and creates one: the count stays the same
+        await repository.delete("a")
+        await repository.insert(dict(entry("c", "Neu"), updated_at=T0 + timedelta(minutes=1)))
+        await reconciler.sync_once()
+        return index.entry_ids()
+
+    assert asyncio.run(scenario()) == {"b", "c"}
@@ -0,0 +1,69 @@
+import asyncio
+from datetime import timedelta
+
+from stats import RECONCILE_LEASE, counter_delta, counters_from_totals, entry_counters, reconcile_stats, stats_view
+from storage.memory import MemoryStorage
+
+
+def with_attachments(category, *sizes):
+    return {"id": "a", "category": category,
+            "attachments": [{"file_type": "images", "file_size": size} for size in sizes]}
+
+
+def test_entry_counters():
+    assert entry_counters(with_attachments("IT", 10, 5)) == {
+        "entries": 1, "category:IT": 1, "attachments": 2, "attachment_bytes": 15,
+        "type:images:count": 2, "type:images:bytes": 15,
+    }
+    assert entry_counters(None) == {}
+
+
+def test_counter_delta_of_a_recategorized_entry():
+    assert counter_delta(with_attachments("IT", 10), with_attachments("Wartung")) == {
+        "category:IT": -1, "category:Wartung": 1, "attachments": -1, "attachment_bytes": -10,
+        "type:images:count": -1, "type:images:bytes": -10,
+    }
+
+
+def test_counters_from_totals_match_per_entry_counters():
+    totals = {"categories": {"IT": 2, None: 1}, "attachment_types": {None: {"count": 1, "bytes": 4}}}
+    assert counters_from_totals(totals) == {
+        "entries": 3, "category:IT": 2, "attachments": 1, "attachment_bytes": 4,
+        "type:other:count": 1, "type:other:bytes": 4,
+    }
+
+
+def test_stats_view_skips_empty_counters():
+    view = stats_view({"entries": 1, "category:IT": 1, "category:Alt": 0, "type:images:count": 1})
+    assert view["categories"] == {"IT": 1}
+    assert view["categories_count"] == 1
+    assert view["attachment_types"] == {"images": {"count": 1, "bytes": 0}}
+
+
+def test_reconcile_corrects_drifted_counters():
+    async def scenario():
+        storage = MemoryStorage()
+        await storage.entries.insert_many([dict(with_attachments("IT", 3), id="a"), dict(with_attachments("IT"), id="b")])
+        await storage.stats.apply({"entries": 5, "category:Alt": 2})
+        version = await storage.content_version()
+        counters = await reconcile_stats(storage)
+        return counters, await storage.stats.get_all(), await storage.content_version() > version
+
+    counters, stored, bumped = asyncio.run(scenario())
+    assert stored == counters
+    assert stored["entries"] == 2 and "category:Alt" not in stored
+    assert bumped
+
+
+def test_reconcile_skips_while_another_worker_holds_the_lease():
+    async def scenario():
+        storage = MemoryStorage()
+        await storage.entries.insert(with_attachments("IT"))
+        await storage.acquire_lease(RECONCILE_LEASE, "other-worker", timedelta(minutes=1))
+        skipped = await reconcile_stats(storage)
+        await storage.release_lease(RECONCILE_LEASE, "other-worker")
+        return skipped, await storage.stats.get_all(), await reconcile_stats(storage)
+
+    skipped, stored, counters = asyncio.run(scenario())
+    assert skipped is None and stored == {}
+    assert counters["entries"] == 1